@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+'''
+Micro-benchmark of the bibtex parser against the previous implementation
+(Citenet.bibtex2dic/findNextBracket, reproduced below).
+
+Usage: python benchmarks/bench_bibtex.py [iterations]
+'''
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from citenet import bibtex
+
+ENTRY = u'''@article{lecy2010nonprofit,
+  title={Nonprofit sector growth and density: Testing theories of government support},
+  author={Lecy, Jesse D and Van Slyke, David M},
+  journal={Journal of Public Administration Research and Theory},
+  volume={23},
+  number={1},
+  pages={189--214},
+  year={2013},
+  publisher={Oxford University Press}
+}
+'''
+
+NESTED = u'''@inproceedings{moreda2015citation,
+  title={A {Citation} {Network} of the {{Public}} {Administration} literature},
+  author={Moreda, Diego and Lecy, Jesse},
+  booktitle={Proceedings of the {ACM} conference},
+  pages={1--10},
+  year={2015},
+  organization={ACM}
+}
+'''
+
+
+def findNextBracket(s, ind):
+    nleft = 1
+    while ind < len(s):
+        if s[ind] == '}':
+            nleft -= 1
+        elif s[ind] == '{':
+            nleft += 1
+        if nleft == 0:
+            return ind
+        ind += 1
+
+    return -1
+
+
+def bibtex2dic(t):
+    res = dict()
+    p = t.find('{')
+    res["type"] = t[1:p]
+    oldP = p
+    p = t.find(",", p)
+    res["bibtexkey"] = t[oldP + 1:p]
+    while p < len(t):
+        oldP = p + 2
+        p = t.find("={", p)
+        if -1 == p:
+            break
+        k = t[oldP:p].strip()
+        oldP = p + 2
+        p = findNextBracket(t, oldP)
+        if -1 == p:
+            break
+        res[k] = t[oldP:p]
+    return res
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    for name, entry in (('flat', ENTRY), ('nested', NESTED)):
+        assert bibtex.parse(entry) == bibtex2dic(entry), name
+        old = min(timeit.repeat(lambda: bibtex2dic(entry), number=n, repeat=3))
+        new = min(timeit.repeat(lambda: bibtex.parse(entry), number=n, repeat=3))
+        print '%-7s old %8.2f us/entry   new %8.2f us/entry   speedup %.1fx' % \
+            (name, old / n * 1e6, new / n * 1e6, old / new)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+'''
+End to end benchmark of a crawl against the local Scholar stand-in
+(benchmarks/standin.py): settings handshake, seed search, then the
+citations of every publication in the frontier, with the BibTeX entries
+parsed and written to a result database, as in a real search.
+
+Usage: python benchmarks/bench_crawl.py [-levels N] [-maxpl N] [-seeds N]
+           [-latency S] [-captcha P] [-forbidden P] [-block P]
+           [-inflight N] [-rate R] [-policy P] [-db PATH]
+
+Captchas, blocks and 403 pages are retried at once (no backoff), and
+counted. The request rate is not limited unless -rate is given.
+'''
+
+import logging
+import os
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+
+from citenet.cmdline import get_arg
+from citenet.crawler import Crawl, Session
+from citenet.db import DBConnection
+from citenet.headless import HeadlessCrawl, new_header
+from citenet.shard import Backoff
+from standin import StandIn
+
+
+class NoBackoff(Backoff):
+    '''
+    Retries at once, counting the failures by kind
+    '''
+    def __init__(self):
+        Backoff.__init__(self)
+        self.counts = dict()
+
+    def delay(self, kind=None):
+        kind = kind or 'error'
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+        return 0
+
+
+class TimedCrawl(Crawl):
+    '''
+    Crawl keeping the time taken by each database write
+    '''
+    def __init__(self, *args):
+        Crawl.__init__(self, *args)
+        self.writes = []
+
+    def save_publications(self, *args):
+        t = time.time()
+        try:
+            return Crawl.save_publications(self, *args)
+        finally:
+            self.writes.append(time.time() - t)
+
+
+def percentile(values, p):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+def main():
+    # the crawl logs every publication and retry: only errors are shown
+    logging.basicConfig(level=logging.ERROR, format='%(message)s')
+    levels = int(get_arg('-levels', 2))
+    server = StandIn(latency=float(get_arg('-latency', 0)),
+                     captcha=float(get_arg('-captcha', 0)),
+                     forbidden=float(get_arg('-forbidden', 0)),
+                     block=float(get_arg('-block', 0))).start()
+    session = Session(server.url, int(get_arg('-inflight', 4)), float(get_arg('-rate', 0)))
+
+    path = get_arg('-db')
+    if path is None:
+        fd, path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+    dbcon = DBConnection(path)
+    dbcon.open()
+    crawl = TimedCrawl(dbcon)
+    headless = HeadlessCrawl(session)
+    headless.backoff = NoBackoff()
+
+    start = time.time()
+    try:
+        headless.retry(session.handshake)
+        query = u'nonprofit governance'
+        seeds = headless.seeds(headless.candidates(query, int(get_arg('-seeds', 5))))
+        crawl.create(new_header(query, seeds, levels, get_arg('-maxpl', 30),
+                                policy=get_arg('-policy', 'order')), seeds)
+        crawl.load()
+        headless.run(crawl)
+    finally:
+        elapsed = time.time() - start
+        crawl.close()
+        server.stop()
+
+    counts = server.counts
+    pages = counts.get('pages', 0) + counts.get('bibtex', 0)
+    rss = 0
+    if resource is not None:
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == 'darwin':
+            rss /= 1024
+    print '%-22s %9.2f s' % ('elapsed', elapsed)
+    print '%-22s %9i  (%i results pages, %i BibTeX)' % \
+        ('pages', pages, counts.get('pages', 0), counts.get('bibtex', 0))
+    print '%-22s %9.1f' % ('pages/s', pages / elapsed)
+    print '%-22s %9i' % ('publications', crawl.total_records)
+    print '%-22s %9.1f' % ('publications/s', crawl.total_records / elapsed)
+    print '%-22s %9.2f ms mean, %.2f ms p95 (%i writes)' % \
+        ('DB write latency', 1e3 * sum(crawl.writes) / max(len(crawl.writes), 1),
+         1e3 * percentile(crawl.writes, 0.95), len(crawl.writes))
+    print '%-22s %9.1f MB' % ('peak RSS', rss / 1024.)
+    print '%-22s %9s' % ('retried', ', '.join('%s %i' % kv
+                                              for kv in sorted(headless.backoff.counts.items())) or '-')
+    if get_arg('-db') is None:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmark of the result page extraction on saved page fixtures.
+
+Usage: python benchmarks/bench_scraper.py [iterations] [fixture.html ...]
+'''
+
+import codecs
+import glob
+import os
+import sys
+import timeit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+
+from citenet import scraper
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    fixtures = sys.argv[2:] or sorted(glob.glob(os.path.join(HERE, 'fixtures', '*.html')))
+
+    for path in fixtures:
+        with codecs.open(path, encoding='utf-8') as f:
+            html = f.read()
+        results = scraper.parse_results(html)
+        t = min(timeit.repeat(lambda: scraper.parse_results(html), number=n, repeat=3)) / n
+        print '%-24s %3i results  %7.2f ms/page  %7.1f pages/s' % \
+            (os.path.basename(path), len(results), t * 1e3, 1 / t)
+
+
+if __name__ == '__main__':
+    main()
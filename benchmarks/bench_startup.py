@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+'''
+Startup time of the GUI: from launching the interpreter to the first
+window shown, split into the imports and the construction of the
+application. Each run is a separate process, so nothing is warmed up but
+the OS file cache. Requires PySide and a display (use xvfb-run on a
+server).
+
+Usage: python benchmarks/bench_startup.py [-runs N]
+'''
+
+import os
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+
+from citenet.cmdline import get_arg
+
+CHILD = '''
+import time
+start = time.time()
+import sys
+sys.path.insert(0, %r)
+from PySide.QtGui import QApplication
+import citenet.citenet as citenet
+imported = time.time()
+app = citenet.app = QApplication(sys.argv)
+s = citenet.Citenet()
+app.processEvents()
+shown = time.time()
+print start, imported, shown
+sys.stdout.flush()
+import os
+os._exit(0)
+''' % os.path.join(HERE, '..')
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+def main():
+    runs = int(get_arg('-runs', 10))
+    totals, imports, builds = [], [], []
+    for _ in xrange(runs):
+        launched = time.time()
+        out = subprocess.check_output([sys.executable, '-c', CHILD])
+        start, imported, shown = [float(v) for v in out.split()[-3:]]
+        totals.append(shown - launched)
+        imports.append(imported - start)
+        builds.append(shown - imported)
+
+    for name, values in (('time to first window', totals),
+                         ('imports', imports),
+                         ('first window', builds)):
+        print '%-22s %8.1f ms median, %.1f ms p90 (%d runs)' % \
+            (name, 1e3 * percentile(values, 0.5), 1e3 * percentile(values, 0.9), runs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+'''
+Local stand-in for Google Scholar, serving synthetic (or recorded) result
+pages and BibTeX exports, with configurable latency and injected captcha,
+403 and block pages. The citation graph is generated deterministically
+from the paper ids, so runs against it are repeatable.
+
+Usage: python benchmarks/standin.py [-port N] [-latency S] [-captcha P]
+                                    [-forbidden P] [-block P] [-papers N]
+                                    [-record CACHE]
+
+-record serves the pages stored in a response cache file (see
+citenet/cache.py) when available. The crawler is pointed at the stand-in
+with -scholarurl http://127.0.0.1:PORT/
+'''
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+import os
+import random
+from SocketServer import ThreadingMixIn
+import sys
+import threading
+import time
+from urlparse import parse_qs, urljoin, urlparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from citenet.cmdline import get_arg
+from citenet.fetcher import SCHOLAR_URL
+
+PAGE_SIZE = 10
+MAX_PAGE_SIZE = 100
+
+WORDS = ('nonprofit sector governance network density policy growth public '
+         'administration theory evidence government support citation '
+         'analysis management performance').split()
+
+PAGE = u'''<!doctype html><html><head><title>Scholar</title><meta charset="utf-8"></head>
+<body><div id="gs_ab_md">About %(total)d results</div><div id="gs_ccl_results">
+%(results)s
+</div></body></html>'''
+
+RESULT = u'''<div class="gs_r"><div class="gs_ri"><h3 class="gs_rt"><a href="http://example.org/paper%(id)d">%(title)s</a></h3>
+<div class="gs_a">%(author)s - %(journal)s, %(year)d - example.org</div>
+<div class="gs_fl">%(cited)s<a href="/scholar?q=related:R%(id)d:scholar.google.com/&amp;hl=en&amp;as_sdt=0,5">Related articles</a> %(bib)s</div></div></div>'''
+
+BIB = u'<a href="/scholar.bib?q=info:I%(id)d:scholar.google.com/&amp;output=citation&amp;scisig=AAGBfm0&amp;scisf=4&amp;hl=en">Import into BibTeX</a>'
+
+CITED = u'<a href="/scholar?cites=%(id)d&amp;as_sdt=2005&amp;sciodt=0,5&amp;hl=en">Cited by %(citedby)d</a> '
+
+BIBTEX = u'''@article{%(key)s,
+  title={%(title)s},
+  author={%(author)s},
+  journal={%(journal)s},
+  volume={%(volume)d},
+  number={%(number)d},
+  pages={%(first)d--%(last)d},
+  year={%(year)d},
+  publisher={Example Press}
+}
+'''
+
+SETTINGS = u'''<!doctype html><html><body>
+<form action="/scholar_setprefs" method="get">
+<input type="hidden" name="scisig" value="AAGBfm0">
+<input type="hidden" name="hl" value="en">
+<input type="radio" name="scis" id="scis0" value="no" checked>
+<input type="radio" name="scis" id="scis1" value="yes">
+<select name="scisf"><option value="4">BibTeX</option></select>
+<button type="submit" class="gs_btn_act" name="save">Save</button>
+</form></body></html>'''
+
+CAPTCHA = u'''<!doctype html><html><body><form action="/sorry/CaptchaRedirect">
+<img id="gs_captcha_c" src="/captcha.png"><p>Please show you're not a robot</p>
+</form></body></html>'''
+
+BLOCK = u'''<!doctype html><html><body><p>Our systems have detected unusual traffic
+from your computer network. This page checks to see if it's really you sending
+the requests, and not a robot. We're sorry, but your computer or network may be
+sending automated queries.</p></body></html>'''
+
+FORBIDDEN = u'''<!doctype html><html><body><p>403. That's an error.</p>
+<p>/+/+/+/+/+ Your client does not have permission to get this URL.</p></body></html>'''
+
+
+class Graph(object):
+    '''
+    Synthetic citation graph over papers 1..papers: the papers citing each
+    one, and their metadata, are derived from the paper id
+    '''
+    def __init__(self, papers=20000, max_citedby=60):
+        self.papers = papers
+        self.max_citedby = max_citedby
+
+    def citedby(self, p):
+        return random.Random(p * 7919).randint(0, self.max_citedby)
+
+    def citing(self, p):
+        rnd = random.Random(p)
+        return [rnd.randint(1, self.papers) for _ in xrange(self.citedby(p))]
+
+    def search(self, q):
+        rnd = random.Random(q)
+        return [rnd.randint(1, self.papers) for _ in xrange(100)]
+
+    def paper(self, p):
+        rnd = random.Random(-p)
+        first = rnd.randint(1, 500)
+        return dict(id=p,
+                    key='author%d%d' % (p, 1990 + p % 30),
+                    title=' '.join(rnd.choice(WORDS) for _ in xrange(6)).capitalize() + ' %d' % p,
+                    author='Author, A and Writer, B%d' % (p % 97),
+                    journal='Journal of %s' % rnd.choice(WORDS).capitalize(),
+                    volume=rnd.randint(1, 40), number=rnd.randint(1, 12),
+                    first=first, last=first + rnd.randint(5, 30),
+                    year=1990 + p % 30, citedby=self.citedby(p))
+
+    def results_page(self, ids, start, bibtex=True, num=PAGE_SIZE):
+        results = []
+        for p in ids[start:start + num]:
+            d = self.paper(p)
+            d['cited'] = CITED % d if d['citedby'] else u''
+            d['bib'] = BIB % d if bibtex else u''
+            results.append(RESULT % d)
+        return PAGE % dict(total=len(ids), results=u'\n'.join(results))
+
+    def bibtex(self, p):
+        return BIBTEX % self.paper(p)
+
+
+class Handler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, body, status=200, content_type='text/html', headers=()):
+        body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', '%s; charset=utf-8' % content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for k, v in headers:
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def redirect(self, location, headers=()):
+        self.send_response(302)
+        self.send_header('Location', location)
+        self.send_header('Content-Length', '0')
+        for k, v in headers:
+            self.send_header(k, v)
+        self.end_headers()
+
+    def do_GET(self):
+        server = self.server
+        server.count('requests')
+        if server.latency:
+            time.sleep(server.latency)
+
+        url = urlparse(self.path)
+        args = dict((k, v[0]) for k, v in parse_qs(url.query).items())
+
+        if url.path == '/ncr':
+            return self.redirect('/', [('Set-Cookie', 'NID=standin; path=/')])
+        if url.path == '/scholar_setprefs':
+            cf = 'CF=%s' % args.get('scisf', '') if args.get('scis') == 'yes' else 'CF=0'
+            return self.redirect('/scholar?hl=en', [('Set-Cookie', 'GSP=ID=standin:%s; path=/' % cf)])
+        if url.path.startswith('/sorry'):
+            return self.reply(BLOCK, 503)
+
+        # injected failures
+        kind = server.inject()
+        if kind == 'captcha':
+            return self.reply(CAPTCHA)
+        elif kind == 'block':
+            return self.redirect('/sorry/index?continue=%s' % self.path)
+        elif kind == 'forbidden':
+            return self.reply(FORBIDDEN, 403)
+
+        recorded = server.recorded(self.path)
+        if recorded is not None:
+            final_url, html, status, content_type = recorded
+            return self.reply(html, status, content_type)
+
+        graph = server.graph
+        start = int(args.get('start', 0))
+        num = min(int(args.get('num', PAGE_SIZE)), MAX_PAGE_SIZE)
+        # the BibTeX links are only shown once enabled in the settings
+        bibtex = 'CF=4' in self.headers.get('Cookie', '')
+        if url.path == '/scholar_settings':
+            self.reply(SETTINGS)
+        elif url.path == '/scholar.bib':
+            server.count('bibtex')
+            p = int(args.get('q', 'info:I0:').split(':')[1][1:])
+            self.reply(graph.bibtex(p), content_type='text/plain')
+        elif url.path == '/scholar' and 'cites' in args:
+            server.count('pages')
+            self.reply(graph.results_page(graph.citing(int(args['cites'])), start, bibtex, num))
+        elif url.path == '/scholar' and 'q' in args:
+            server.count('pages')
+            self.reply(graph.results_page(graph.search(args['q']), start, bibtex))
+        elif url.path in ('/', '/scholar'):
+            self.reply(PAGE % dict(total=0, results=u''))
+        else:
+            self.reply(u'Not found', 404)
+
+
+class StandIn(ThreadingMixIn, HTTPServer):
+    '''
+    The stand-in server. Failures are injected with the given probabilities
+    (per request), and every request waits latency seconds.
+    '''
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0, captcha=0, forbidden=0, block=0,
+                 papers=20000, record=None, seed=0):
+        HTTPServer.__init__(self, ('127.0.0.1', port), Handler)
+        self.latency = latency
+        self.rates = [('captcha', captcha), ('forbidden', forbidden), ('block', block)]
+        self.graph = Graph(papers)
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = dict()
+        self.cache = None
+        if record is not None:
+            from citenet.cache import ResponseCache
+            self.cache = ResponseCache(record, ttl=float('inf'))
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d/' % self.server_address[1]
+
+    def count(self, what):
+        with self.lock:
+            self.counts[what] = self.counts.get(what, 0) + 1
+
+    def inject(self):
+        with self.lock:
+            r = self.random.random()
+        for kind, p in self.rates:
+            if r < p:
+                self.count(kind)
+                return kind
+            r -= p
+        return None
+
+    def recorded(self, path):
+        if self.cache is None:
+            return None
+        return self.cache.get(urljoin(SCHOLAR_URL, path))
+
+    def start(self):
+        t = threading.Thread(target=self.serve_forever)
+        t.daemon = True
+        t.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    server = StandIn(int(get_arg('-port', 8080)), float(get_arg('-latency', 0)),
+                     float(get_arg('-captcha', 0)), float(get_arg('-forbidden', 0)),
+                     float(get_arg('-block', 0)), int(get_arg('-papers', 20000)),
+                     get_arg('-record'))
+    print 'Scholar stand-in listening on %s' % server.url
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
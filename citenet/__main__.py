@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+'''
+citenet - Citation Network Analyzer
+Copyright (C) 2015 Jesse Lecy <jdlecy@gmail.com>, with contributions from
+Diego Moreda <diego.plan9@gmail.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along
+with this program; if not, write to the Free Software Foundation, Inc.,
+51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+Usage: python -m citenet [COMMAND] [ARGS]
+
+    gui        the search application (default), see citenet/citenet.py
+    crawl      create or resume a search from the command line, without Qt
+    batch      run the searches of a manifest under a shared request budget
+    shard      crawl a search with several worker processes
+    export     export a result database to CSV, Parquet, Arrow or a graph
+    graph      compute and show the citation graph metrics of a database
+
+Run a command without arguments for its options.
+'''
+
+import runpy
+import sys
+
+# command: module run for it
+COMMANDS = {
+    'gui': 'citenet.citenet',
+    'crawl': 'citenet.headless',
+    'batch': 'citenet.batch',
+    'shard': 'citenet.shard',
+    'export': 'citenet.export',
+    'graph': 'citenet.graph',
+}
+
+
+def main():
+    command = 'gui'
+    if len(sys.argv) > 1 and not sys.argv[1].startswith('-'):
+        command = sys.argv.pop(1)
+    if command not in COMMANDS:
+        print __doc__[__doc__.index('Usage:'):]
+        return 2
+    # the command modules read their options from sys.argv, and are only
+    # imported when run (the GUI one needs PySide)
+    runpy.run_module(COMMANDS[command], run_name='__main__', alter_sys=True)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+'''
+citenet - Citation Network Analyzer
+Copyright (C) 2015 Jesse Lecy <jdlecy@gmail.com>, with contributions from
+Diego Moreda <diego.plan9@gmail.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along
+with this program; if not, write to the Free Software Foundation, Inc.,
+51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+Several searches run one after the other from a manifest. Usage:
+
+    python -m citenet batch MANIFEST [-budget N] [-dedupcache N]
+                                     [-inflight N] [-rate R]
+                                     [-cache PATH | -nocache] [-offline]
+                                     [-scholarurl URL]
+                                     [-cookies PATH | -nocookies]
+                                     [-metrics PATH] [-metricsport PORT]
+
+The manifest is a JSON file such as
+
+    {"budget": 20000,
+     "defaults": {"levels": 2, "maxpl": 10,
+                  "seeds": {"top": 5, "by": "citedby", "of": 20}},
+     "jobs": [{"query": "nonprofit governance"},
+              {"query": "board diversity", "db": "board.sqlite",
+               "seeds": "1-3,7", "ppl": 20, "policy": "citedby"}]}
+
+Each job is a search, stored in its db (by default named after the query,
+next to the manifest). Its seeds are either the results at the given
+positions, or the top ones of the first "of" results, by cited by count
+("by": "citedby") or in the order found ("by": "order"). levels, maxpl,
+ppl and policy are as in the crawl command.
+
+All the jobs share one Scholar session, request rate and backoff, and the
+BibTeX entries already retrieved are reused by the later jobs. The runner
+stops once budget requests have been made; running it again resumes the
+unfinished jobs, and skips the finished ones. The metrics options are as
+in the crawl command.
+'''
+
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+
+from cmdline import get_arg
+from crawler import Crawl, EntryMemo
+from db import DBConnection
+from fetcher import FetchError
+from frontier import POLICIES
+from headless import (DEFAULT_SEEDS, HeadlessCrawl, get_budget, metrics_reporter, new_header,
+                      open_session, parse_seeds)
+
+logger = logging.getLogger('main')
+
+JOB_KEYS = ('query', 'db', 'seeds', 'levels', 'maxpl', 'ppl', 'policy')
+RE_NON_WORD = re.compile(r'\W+', re.U)
+
+
+class ManifestError(Exception):
+    pass
+
+
+class SeedRule(object):
+    '''
+    Which results of the query become the seeds: the ones at the given
+    positions (a list like "1-5,8"), or the top ones of the first of
+    results, by cited by count or in order
+    '''
+    def __init__(self, rule):
+        self.positions = None
+        try:
+            if isinstance(rule, basestring):
+                self.positions = parse_seeds(rule)
+                self.count = self.positions[-1]
+            else:
+                self.top = int(rule['top'])
+                self.by = rule.get('by', 'citedby')
+                self.count = max(int(rule.get('of', 20)), self.top)
+                if self.by not in ('citedby', 'order') or self.top < 1:
+                    raise ValueError(rule)
+        except (KeyError, TypeError, ValueError), e:
+            raise ManifestError('Invalid seeds %r: %s' % (rule, e))
+
+    def choose(self, results):
+        if self.positions is not None:
+            return [results[i - 1] for i in self.positions if i <= len(results)]
+        if self.by == 'citedby':
+            results = sorted(results, key=lambda r: -int(r.citedby or 0))
+        return results[:self.top]
+
+
+class Job(object):
+    def __init__(self, spec, defaults, base_dir):
+        params = dict(defaults)
+        params.update(spec)
+        unknown = set(params) - set(JOB_KEYS)
+        if unknown:
+            raise ManifestError('Unknown job keys: %s' % ', '.join(sorted(unknown)))
+        if not params.get('query'):
+            raise ManifestError('Job without query: %r' % spec)
+        self.query = unicode(params['query'])
+        db = params.get('db') or RE_NON_WORD.sub(u'_', self.query.lower()).strip(u'_') + u'.sqlite'
+        self.path = os.path.join(base_dir, db)
+        self.seeds = SeedRule(params.get('seeds', DEFAULT_SEEDS))
+        self.levels = int(params.get('levels', 2))
+        self.maxpl = int(params.get('maxpl', 10))
+        self.ppl = params.get('ppl')
+        self.policy = params.get('policy')
+        if self.policy is not None and self.policy not in POLICIES:
+            raise ManifestError('Unknown policy "%s" (%s)' % (self.policy, ', '.join(sorted(POLICIES))))
+        self.status = 'pending'
+        self.records = 0
+        self.requests = 0
+
+    def header(self, seeds):
+        return new_header(self.query, seeds, self.levels, self.maxpl, self.ppl, self.policy)
+
+
+def load_manifest(path):
+    '''
+    (budget, jobs) described in a manifest file
+    '''
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (IOError, ValueError), e:
+        raise ManifestError('Can not read %s: %s' % (path, e))
+    base_dir = os.path.dirname(os.path.abspath(path))
+    defaults = manifest.get('defaults', dict())
+    jobs = [Job(spec, defaults, base_dir) for spec in manifest.get('jobs', [])]
+    if not jobs:
+        raise ManifestError('No jobs in %s' % path)
+    paths = [job.path for job in jobs]
+    if len(set(paths)) < len(paths):
+        raise ManifestError('Several jobs use the same db')
+    return manifest.get('budget'), jobs
+
+
+class BatchRunner(object):
+    '''
+    Runs the jobs of a manifest in order, through a single HeadlessCrawl
+    (and so one session, rate, backoff and budget)
+    '''
+    def __init__(self, headless, dedupcache=100000):
+        self.headless = headless
+        self.dedupcache = dedupcache
+
+    def stored(self, dbcon):
+        '''
+        Whether the database holds a search already
+        '''
+        try:
+            return 'query' in dbcon.read_header()
+        except sqlite3.Error:
+            return False
+
+    def run_job(self, job):
+        headless = self.headless
+        fetcher = headless.session.fetcher
+        before = fetcher.requests
+        exists = os.path.exists(job.path)
+        dbcon = DBConnection(job.path)
+        dbcon.open()
+        crawl = Crawl(dbcon, self.dedupcache)
+        try:
+            if exists and self.stored(dbcon):
+                crawl.open()
+                crawl.load(job.policy)
+            else:
+                logger.info('Looking for the seeds of "%s"' % job.query)
+                results = headless.candidates(job.query, job.seeds.count)
+                seeds = headless.seeds(job.seeds.choose(results))
+                if not seeds:
+                    logger.error('No seeds found for "%s"' % job.query)
+                    job.status = 'failed'
+                    return
+                crawl.create(job.header(seeds), seeds)
+                crawl.load(job.policy)
+                logger.info('Search created with %d seeds in %s' % (len(seeds), job.path))
+            if not crawl.scrape_done:
+                headless.run(crawl)
+            job.status = 'done' if crawl.scrape_done else 'pending'
+            job.records = crawl.total_records
+        finally:
+            crawl.close()
+            job.requests = fetcher.requests - before
+
+    def run(self, jobs):
+        '''
+        Run the jobs until all are done or the budget is used up
+        '''
+        for i, job in enumerate(jobs):
+            if self.headless.exhausted():
+                break
+            logger.info('Job %d of %d: "%s"' % (i + 1, len(jobs), job.query))
+            self.run_job(job)
+            logger.info('Job %d %s: %d records, %d requests' %
+                        (i + 1, job.status, job.records, job.requests))
+        return jobs
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1].startswith('-'):
+        print __doc__[__doc__.index('Usage:'):]
+        return 2
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    try:
+        budget, jobs = load_manifest(sys.argv[1])
+    except ManifestError, e:
+        logger.error(e)
+        return 2
+    if get_budget() is not None:
+        budget = get_budget()
+
+    session, cache = open_session()
+    session.memo = EntryMemo()
+    headless = HeadlessCrawl(session, budget)
+    runner = BatchRunner(headless, int(get_arg("-dedupcache", 100000)))
+    reporter = metrics_reporter()
+    try:
+        headless.retry(session.start)
+        runner.run(jobs)
+    except KeyboardInterrupt:
+        logger.info('Stopped; run the manifest again to resume')
+    except FetchError, e:
+        logger.error('Stopped: %s' % e)
+    finally:
+        reporter.close()
+        if cache is not None:
+            cache.close()
+
+    for job in jobs:
+        print '%-8s %8d records %8d requests  %s' % (job.status, job.records, job.requests,
+                                                      job.query.encode('utf-8'))
+    print '%d requests, %d BibTeX entries reused' % (session.fetcher.requests, session.memo.hits)
+    return 0 if all(job.status == 'done' for job in jobs) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+'''
+citenet - Citation Network Analyzer
+Copyright (C) 2015 Jesse Lecy <jdlecy@gmail.com>, with contributions from
+Diego Moreda <diego.plan9@gmail.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along
+with this program; if not, write to the Free Software Foundation, Inc.,
+51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+'''
+
+import re
+
+RE_HEADER = re.compile(r'\s*@\s*([\w-]+)\s*[{(]\s*([^,\s]*)\s*,?')
+RE_FIELD  = re.compile(r'[\s,]*([\w:.+-]+)\s*=\s*')
+RE_BARE   = re.compile(r'[^,}\s]*')
+RE_BRACES = re.compile(r'[{}]')
+RE_QUOTED = re.compile(r'[{}"]')
+
+
+def _braced(t, p):
+    '''
+    Content of the braced value starting at t[p] ('{'), and the position
+    after the closing brace. Only the braces are visited, with a compiled
+    regex, instead of walking the value one character at a time.
+    '''
+    depth = 0
+    for m in RE_BRACES.finditer(t, p):
+        if m.group() == '{':
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return t[p + 1:m.start()], m.end()
+    return None, len(t)
+
+
+def _quoted(t, p):
+    '''
+    Content of the quoted value starting at t[p] ('"'); quotes inside braces
+    do not end the value
+    '''
+    depth = 0
+    for m in RE_QUOTED.finditer(t, p + 1):
+        c = m.group()
+        if c == '{':
+            depth += 1
+        elif c == '}':
+            depth -= 1
+        elif depth == 0:
+            return t[p + 1:m.start()], m.end()
+    return None, len(t)
+
+
+def parse(t):
+    '''
+    Parse a single bibtex entry into a dict with its fields, plus "type" and
+    "bibtexkey". Values are returned as written, without the outer braces or
+    quotes. Parsing stops at the first malformed field.
+    '''
+    res = dict()
+    m = RE_HEADER.match(t)
+    if m is None:
+        return res
+    res["type"] = m.group(1)
+    res["bibtexkey"] = m.group(2)
+
+    p = m.end()
+    n = len(t)
+    while p < n:
+        m = RE_FIELD.match(t, p)
+        if m is None:
+            break
+        k = m.group(1)
+        p = m.end()
+        if p >= n:
+            break
+        c = t[p]
+        if c == '{':
+            v, p = _braced(t, p)
+        elif c == '"':
+            v, p = _quoted(t, p)
+        else:
+            b = RE_BARE.match(t, p)
+            v, p = b.group(), b.end()
+        if v is None:
+            break
+        res[k] = v
+    return res
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+'''
+citenet - Citation Network Analyzer
+Copyright (C) 2015 Jesse Lecy <jdlecy@gmail.com>, with contributions from
+Diego Moreda <diego.plan9@gmail.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along
+with this program; if not, write to the Free Software Foundation, Inc.,
+51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+'''
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import urllib
+from urlparse import parse_qsl, urlsplit, urlunsplit
+import zlib
+
+logger = logging.getLogger('main')
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.citenet_cache.sqlite')
+
+# requests made for their cookies, never answered from the cache
+NO_CACHE = ('/ncr', '/scholar_setprefs')
+
+SCHEMA = [
+    'create table if not exists Responses(Key blob primary key, Url text, FinalUrl text, Status integer, ContentType text, Body blob, Size integer, Stored real, Accessed real);',
+    'create index if not exists Responses_Accessed on Responses(Accessed);',
+]
+
+
+def normalize(url):
+    '''
+    Normalized form of an absolute url: lowercase scheme and host, query
+    parameters sorted, without fragment
+    '''
+    scheme, netloc, path, query, _ = urlsplit(url)
+    query = urllib.urlencode(sorted(parse_qsl(query, keep_blank_values=True)))
+    return urlunsplit((scheme.lower(), netloc.lower(), path or '/', query, ''))
+
+
+def url_key(url):
+    return sqlite3.Binary(hashlib.sha1(normalize(url)).digest())
+
+
+class ResponseCache(object):
+    '''
+    On-disk cache of fetched pages, in a SQLite file: the bodies are stored
+    compressed, keyed by the sha1 of the normalized url. Entries expire
+    after ttl seconds, and the least recently used ones are evicted when
+    the bodies take more than max_size bytes.
+
+    The file can be shared by several processes, and the cache by several
+    threads.
+    '''
+    def __init__(self, path=DEFAULT_PATH, ttl=30*24*3600, max_size=256*1024*1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.con = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.con.execute('pragma journal_mode = WAL;')
+        for q in SCHEMA:
+            self.con.execute(q)
+        self.con.execute('delete from Responses where Stored < ?;', (time.time() - self.ttl,))
+        self.con.commit()
+        self.size = self.con.execute('select coalesce(sum(Size), 0) from Responses;').fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            if self.con is not None:
+                self.con.close()
+                self.con = None
+
+    def cacheable(self, url):
+        return urlsplit(url).path not in NO_CACHE
+
+    def contains(self, url):
+        with self.lock:
+            r = self.con.execute('select Stored from Responses where Key = ?;',
+                                 (url_key(url),)).fetchone()
+        return r is not None and r[0] >= time.time() - self.ttl
+
+    def get(self, url):
+        '''
+        (final url, html, status, content type) stored for url, or None
+        '''
+        key = url_key(url)
+        now = time.time()
+        with self.lock:
+            r = self.con.execute('select FinalUrl, Status, ContentType, Body, Stored from Responses where Key = ?;',
+                                 (key,)).fetchone()
+            if r is None or r[4] < now - self.ttl:
+                self.misses += 1
+                return None
+            self.con.execute('update Responses set Accessed = ? where Key = ?;', (now, key))
+            self.con.commit()
+            self.hits += 1
+        return r[0], zlib.decompress(str(r[3])).decode('utf-8'), r[1], r[2]
+
+    def put(self, url, final_url, html, status, content_type):
+        body = zlib.compress(html.encode('utf-8'))
+        key = url_key(url)
+        now = time.time()
+        with self.lock:
+            # a replaced entry no longer counts
+            r = self.con.execute('select Size from Responses where Key = ?;', (key,)).fetchone()
+            if r is not None:
+                self.size -= r[0]
+            self.con.execute('insert or replace into Responses values(?, ?, ?, ?, ?, ?, ?, ?, ?);',
+                             (key, url, final_url, status, content_type,
+                              sqlite3.Binary(body), len(body), now, now))
+            self.size += len(body)
+            if self.size > self.max_size:
+                self.evict()
+            self.con.commit()
+
+    def delete(self, url):
+        key = url_key(url)
+        with self.lock:
+            r = self.con.execute('select Size from Responses where Key = ?;', (key,)).fetchone()
+            if r is not None:
+                self.con.execute('delete from Responses where Key = ?;', (key,))
+                self.con.commit()
+                self.size -= r[0]
+
+    def evict(self):
+        '''
+        Remove the least recently used entries until the cache is down to
+        90% of its maximum size. Called with the lock held.
+        '''
+        target = self.max_size * 0.9
+        rows = self.con.execute('select Key, Size from Responses order by Accessed;').fetchall()
+        keys = []
+        size = self.con.execute('select coalesce(sum(Size), 0) from Responses;').fetchone()[0]
+        for key, n in rows:
+            if size <= target:
+                break
+            keys.append((key,))
+            size -= n
+        self.con.executemany('delete from Responses where Key = ?;', keys)
+        self.size = size
+        logger.info('Response cache: %d entries evicted' % len(keys))
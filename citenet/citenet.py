@@ -19,15 +19,15 @@ with this program; if not, write to the Free Software Foundation, Inc.,
 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 '''
 
-import codecs
+from collections import deque
 from datetime import datetime, timedelta
 import logging
 import os
-import pkg_resources
 from random import normalvariate, lognormvariate
 import sqlite3
 import sys
 import time
+from urlparse import urljoin
 
 from PySide.QtCore import (
     SIGNAL,
@@ -35,7 +35,9 @@ from PySide.QtCore import (
     QObject,
     QSettings,
     QTimer,
+    QUrl,
     Qt,
+    Signal,
 )
 from PySide.QtGui import (
     QApplication,
@@ -45,74 +47,254 @@ from PySide.QtGui import (
     QMessageBox,
 )
 from PySide.QtUiTools import QUiLoader
-from PySide.QtWebKit import QWebView
+
+import bibtex
+from cmdline import get_arg
+from crawler import SETTINGS_URL, Crawl, cites_url, page_size
+from cache import DEFAULT_PATH, ResponseCache
+from db import DBConnection
+from fetcher import COOKIES_PATH, SCHOLAR_URL, HTTPFetcher, Page, load_cookies
+from frontier import DEFAULT_POLICY, POLICIES
+import logpipe
+import metrics
+from ratecontrol import RateController
+import scraper
 
 logger = logging.getLogger('main')
 
+RESOURCES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources')
+
+
+def documents_dir():
+    '''
+    The user's "My Documents" folder on Windows, the home folder elsewhere
+    '''
+    if sys.platform == 'win32':
+        try:
+            import ctypes.wintypes
+            CSIDL_PERSONAL = 5       # My Documents
+            SHGFP_TYPE_CURRENT = 1   # Get current, not default value
+
+            buf = ctypes.create_unicode_buffer(ctypes.wintypes.MAX_PATH)
+            ctypes.windll.shell32.SHGetFolderPathW(None, CSIDL_PERSONAL, None,
+                                                   SHGFP_TYPE_CURRENT, buf)
+            return buf.value
+        except Exception:
+            pass
+    return os.path.expanduser('~')
+
+
+class lazy(object):
+    '''
+    Attribute computed by the decorated method the first time it is used,
+    and stored in the instance from then on
+    '''
+    def __init__(self, build):
+        self.build = build
+        self.name = build.__name__
+        self.__doc__ = build.__doc__
+
+    def __get__(self, obj, cls):
+        if obj is None:
+            return self
+        value = obj.__dict__[self.name] = self.build(obj)
+        return value
+
 
 class QTLogHandler(logging.Handler):
     '''
-    Logging handler that outputs to a QTextEdit widget
+    Logging handler that keeps the last messages, and outputs them to a
+    QPlainTextEdit widget. Records can be handled on any thread: the widget
+    is only updated by refresh, on the Qt thread, with all the messages
+    logged since the previous refresh at once.
     '''
-    def __init__(self, dest=None):
+    LINES = 10000   # messages kept, and shown on the widget
+
+    def __init__(self, dest=None, lines=LINES):
         logging.Handler.__init__(self)
-        self.dest = dest
+        self.dest = None
         self.level = logging.DEBUG
+        self.lines = deque(maxlen=lines)
+        self.new = deque(maxlen=lines)   # not shown yet
+        if dest is not None:
+            self.set_dest(dest)
 
     def flush(self):
         pass
 
+    def set_dest(self, dest):
+        dest.setMaximumBlockCount(self.lines.maxlen)
+        self.acquire()
+        try:
+            text = '\n'.join(self.lines)
+            self.new.clear()
+        finally:
+            self.release()
+        dest.setPlainText(text)
+        self.dest = dest
+
+    def refresh(self):
+        '''
+        Show the new messages, if the widget is visible
+        '''
+        if self.dest is None or not self.dest.isVisible():
+            return
+        self.acquire()
+        try:
+            batch = list(self.new)
+            self.new.clear()
+        finally:
+            self.release()
+        if batch:
+            self.dest.appendPlainText('\n'.join(batch))
+
     def emit(self, record):
         try:
             msg = self.format(record)
-            self.dest.append(msg)
+            self.lines.append(msg)
+            self.new.append(msg)
         except (KeyboardInterrupt, SystemExit):
             raise
         except:
             self.handleError(record)
 
 
-class DBConnection(object):
+class WebKitBackend(QObject):
     '''
-    Database connection to a SQLite file
+    Page loader that renders each page in full on a QWebView
     '''
-    def __init__(self, filename):
-        self.filename = filename
-        self.con = None
+    finished = Signal(object)
+    concurrent = False
+    interval = 0     # minimum seconds between requests
+
+    def __init__(self, base_url=SCHOLAR_URL):
+        # QtWebKit takes a while to load, and is only needed with -webkit
+        from PySide.QtWebKit import QWebView
+        QObject.__init__(self)
+        self.base_url = base_url
+        self.view = QWebView()
+        self.view.loadFinished.connect(self.load_finished)
+        self.started = None
+
+    def load(self, url):
+        self.started = time.time()
+        self.view.load(QUrl(urljoin(self.base_url, url)))
+
+    def cached(self, url):
+        return False
+
+    def forget(self, url):
+        pass
 
-    def open(self):
-        self.con = sqlite3.connect(self.filename)
+    # the QWebView cookies are not kept between sessions
+    def session_valid(self):
+        return False
+
+    def save_session(self):
+        pass
+
+    def reset_session(self):
+        pass
+
+    def load_finished(self, ok):
+        if self.started is not None:
+            metrics.observe('network', time.time() - self.started)
+            metrics.count('requests')
+            self.started = None
+        if not ok:
+            self.finished.emit(None)
+            return
+        frame = self.view.page().mainFrame()
+        with metrics.timer('extract'):
+            page = Page(frame.baseUrl().toString(), frame.toHtml(),
+                        text=frame.toPlainText())
+        self.finished.emit(page)
 
-    def close(self):
-        if self.con:
-            self.con.close()
-        self.con = None
+    def throttle(self, rate_control):
+        self.interval = rate_control.delay()
 
-    def commit(self):
-        if self.con:
-            self.con.commit()
+    def submit_settings(self, page):
+        frame = self.view.page().mainFrame()
+        frame.evaluateJavaScript("var ch=document.getElementById(\"scis1\");ch.checked=true;")
+        frame.evaluateJavaScript("var e=document.getElementsByTagName(\"button\");for (var i = 0; i<e.length;i++){if ((e[i].getAttribute(\"class\").indexOf(\"gs_btn_act\") != -1) && (e[i].getAttribute(\"name\") == \"save\")){e[i].click();break;}}")
 
-    def rollback(self):
-        if self.con:
-            self.con.rollback()
 
-    def get_cursor(self):
-        if self.con:
-            return self.con.cursor()
+class HTTPBackend(QObject):
+    '''
+    Page loader that fetches the raw documents over HTTP on a background
+    thread, without rendering them. Results are delivered on the Qt thread
+    via the finished (single page) and finished_many (list of pages)
+    signals; results of superseded loads are discarded.
+    '''
+    finished = Signal(object)
+    finished_many = Signal(object)
+    fetched = Signal(object)
+    concurrent = True
+    interval = 0     # requests are spaced by the fetcher instead
+
+    def __init__(self, base_url=SCHOLAR_URL, max_in_flight=4, rate=1,
+                 cache=None, offline=False, cookies=None):
+        QObject.__init__(self)
+        cookiejar = load_cookies(cookies) if cookies else None
+        self.fetcher = HTTPFetcher(base_url, cookiejar=cookiejar,
+                                   max_in_flight=max_in_flight, rate=rate,
+                                   cache=cache, offline=offline)
+        self.view = None
+        self.seq = 0
+        self.fetched.connect(self.deliver)
+
+    def load(self, url):
+        self.seq += 1
+        seq = self.seq
+        self.fetcher.fetch_async(url, lambda page: self.fetched.emit((seq, page)))
+
+    def load_many(self, urls):
+        self.seq += 1
+        seq = self.seq
+        self.fetcher.fetch_many_async(urls, lambda pages: self.fetched.emit((seq, pages)))
+
+    def cached(self, url):
+        urls = url if isinstance(url, list) else [url]
+        return all(self.fetcher.cached(u) for u in urls)
+
+    def forget(self, url):
+        self.fetcher.forget(url)
+
+    def session_valid(self):
+        return self.fetcher.session_valid()
+
+    def save_session(self):
+        self.fetcher.save_session()
+
+    def reset_session(self):
+        self.fetcher.reset_session()
+
+    def deliver(self, result):
+        seq, page = result
+        if seq != self.seq:
+            return
+        if isinstance(page, list):
+            self.finished_many.emit(page)
         else:
-            logger.warning("Attempting to get cursor, but DB closed")
-            self.open()
-            return self.con.cursor()
+            self.finished.emit(page)
+
+    def throttle(self, rate_control):
+        rate_control.apply(self.fetcher)
+
+    def submit_settings(self, page):
+        url = scraper.settings_prefs_url(page.html)
+        if url is None:
+            logger.warning('Scholar settings form not found')
+            url = page.url
+        self.load(url)
 
 
 class Citenet(QObject):
-    FORMS           = {}     # dict of .ui file paths
     TIMEOUT_CAPTCHA = 60*5   # minutes
     TIMEOUT_BLOCK   = 60*6   # minutes
     ATTEMPTS        = 0
     FORCE_DELAY     = False  # add artificial delays
     was_paused      = False  # detect if the search was paused by the user
-    total_records   = 0      # number of records written to disk to far
     to_be_dumped    = []     # articles to be dumped
 
     SIMULATED_CAPTCHA = False
@@ -140,21 +322,81 @@ class Citenet(QObject):
 
     def load_url(self, url, timeout=30):
         '''
-        Load an url, sleeping for a bit if FORCE_DELAY is enabled. A timer is
-        used for checking for timeout errors due to network connection, etc
+        Load an url, waiting for a bit first if FORCE_DELAY is enabled. The
+        wait runs on a timer, so the event loop is not blocked meanwhile. A
+        timer is used for checking for timeout errors due to network
+        connection, etc
         '''
-        previous_status = self.status_label.text()[8:]
-        self.change_status('Sleeping before request')
-        self.sleep_lognorm()
-        self.change_status(previous_status)
+        self.schedule_request(url, timeout)
+
+    def load_urls(self, urls, timeout=30):
+        '''
+        Load a list of urls concurrently (HTTP backend only), within the
+        politeness budget of the backend. The timeout applies to the whole
+        batch.
+        '''
+        self.schedule_request(urls, timeout*len(urls))
+
+    def schedule_request(self, url, timeout):
+        '''
+        Send the request once the inter-request delay has elapsed. A new
+        request replaces one that is still waiting.
+        '''
+        self.pending_request = (url, timeout)
+        if self.delay_timer.isActive():
+            self.delay_timer.stop()
+
+        # pages in the response cache do not count against the rate
+        delay = 0 if self.backend.cached(url) else self.request_delay()
+        if delay > 0:
+            metrics.observe('request_delay', delay)
+            if self.status_before_delay is None:
+                self.status_before_delay = self.status_label.text()[8:]
+            self.change_status('Sleeping before request')
+            self.delay_timer.start(int(delay*1000))
+        else:
+            self.send_request()
+
+    def send_request(self):
+        url, timeout = self.pending_request
+        self.pending_request = None
+        if self.status_before_delay is not None:
+            self.change_status(self.status_before_delay)
+            self.status_before_delay = None
 
         # launch the timer
         if self.error_timer.isActive():
             self.error_timer.stop()
         self.error_timer.start(timeout*1000)
         self.last_url = url
-        logger.info(url)
-        self.vw.load(url)
+        if isinstance(url, list):
+            logger.info('Fetching %i urls' % len(url))
+            self.backend.load_many(url)
+        else:
+            logger.debug(url)
+            self.backend.load(url)
+
+    def page_loaded(self, page):
+        self.page = page
+        self.batch = None
+        self.loadFinished(page is not None)
+
+    def pages_loaded(self, pages):
+        '''
+        A batch of pages was loaded. The first invalid page (captcha, block)
+        is checked as if it was a single page load, discarding the batch.
+        '''
+        if None in pages:
+            self.page_loaded(None)
+            return
+
+        self.page = pages[-1]
+        for p in pages:
+            if scraper.classify_page(p.url, p.html, p.text) not in (None, 'suspect'):
+                self.page = p
+                break
+        self.batch = pages
+        self.loadFinished(True)
 
     def url_timeout(self):
         self.change_status('Connection error - retrying in 5 minutes',
@@ -166,7 +408,10 @@ class Citenet(QObject):
 
     def url_retry(self):
         self.change_status('Retrying last url')
-        self.load_url(self.last_url)
+        if isinstance(self.last_url, list):
+            self.load_urls(self.last_url)
+        else:
+            self.load_url(self.last_url)
 
     # timer and blocking related functions
     def create_timer(self):
@@ -187,6 +432,13 @@ class Citenet(QObject):
         self.connect(self.timeout_retry_timer, SIGNAL("timeout()"),
                      self.url_retry)
 
+        # inter-request delay
+        self.delay_timer = QTimer()
+        self.delay_timer.setSingleShot(True)
+        self.connect(self.delay_timer, SIGNAL("timeout()"), self.send_request)
+        self.pending_request = None
+        self.status_before_delay = None
+
     def timer_wakeup(self):
         # resume search
         logger.info('%s Resuming search ...' % datetime.now())
@@ -194,23 +446,27 @@ class Citenet(QObject):
         self.do_continue_data_collection()
 
     def detect_captcha(self, page):
-        url = page.baseUrl().toString()
-        txt = ''
-        page_txt = page.toPlainText()
-
-        if 'sorry' in url or\
-           'but your computer or network may be sending automated queries' in page_txt or\
-           not page.findFirstElement("#captcha[name='captcha']").isNull() or\
-           '/+/+/+/+/+' in page_txt or\
-           'not a robot' in page_txt or\
-           not page.findFirstElement("[id*=captcha]").isNull():
+        kind = scraper.classify_page(page.url, page.html, page.text)
+
+        # simulated captcha/block (-simcaptcha, -simblock), once per session
+        if kind is None and self.SIMULATED_CAPTCHA and not self.DONE_CAPTCHA:
+            self.DONE_CAPTCHA = True
+            kind = 'captcha'
+        elif kind is None and self.SIMULATED_BLOCK and not self.DONE_BLOCK:
+            self.DONE_BLOCK = True
+            kind = 'block'
+        self.rate_control.observe(kind, len(self.batch) if self.batch else 1)
+        self.backend.throttle(self.rate_control)
+        if kind is not None:
+            metrics.count('%s_pages' % kind)
+
+        if kind is not None:
             # calculate the extra delay
             delay = 0
             extra_delay = self.ATTEMPTS * 30
 
             # captcha
-            if not page.findFirstElement("#captcha[name='captcha']").isNull() or\
-               not page.findFirstElement("[id*=captcha]").isNull():
+            if kind == 'captcha':
                 logger.warning('Captcha detected')
 
                 if self.FORCE_DELAY:
@@ -219,8 +475,7 @@ class Citenet(QObject):
                 txt = 'Captcha detected'
 
             # block
-            elif 'sorry' in url or\
-                 'but your computer or network may be sending automated queries' in page_txt:
+            elif kind == 'block':
                 logger.warning('Block detected')
 
                 if self.FORCE_DELAY:
@@ -229,9 +484,9 @@ class Citenet(QObject):
                 txt = 'Block detected'
 
             # 403 forbidden
-            elif '/+/+/+/+/+' in page_txt:
+            elif kind == 'forbidden':
                 logger.warning('403/Forbidden detected')
-                logger.info(page_txt)
+                logger.info(page.text)
                 delay = 1
                 txt = '403/Forbidden detected'
 
@@ -249,99 +504,32 @@ class Citenet(QObject):
             self.change_status(txt, red=True)
 
             # enable all the +/- buttons
-            self.win0.setEnabled(True)
-            self.win1.setEnabled(True)
-            self.win2.setEnabled(True)
-            self.win3.setEnabled(True)
-            self.win4.setEnabled(True)
+            for win in self.built_windows():
+                win.setEnabled(True)
 
             return datetime.now() + timedelta(seconds=delay*60)
         else:
             self.ATTEMPTS = 0
             return False
 
-    def sleep_lognorm(self):
+    def request_delay(self):
+        '''
+        Seconds to wait before the next request: the spacing set by the rate
+        controller, plus lognormal jitter if forced
+        '''
+        delay = self.backend.interval
         if self.FORCE_DELAY:
             # careful will negatives!
-            i = max(lognormvariate(0, 1), 0) + 1
-            time.sleep(i)
+            delay += max(lognormvariate(0, 1), 0) + 1
+        return delay
 
     # end timer and blocking related functions
 
-    def findNextBracket(self, s, ind):
-        nleft = 1
-        while ind < len(s):
-            if s[ind] == '}':
-                nleft -= 1
-            elif s[ind] == '{':
-                nleft += 1
-            if nleft == 0:
-                return ind
-            ind += 1
-
-        return -1
-
-    def bibtex2dic(self, t):
-        res = dict()
-        p = t.find('{')
-        res["type"] = t[1:p]
-        oldP = p
-        p = t.find(",", p)
-        res["bibtexkey"] = t[oldP + 1:p]
-        while p < len(t):
-            oldP = p + 2
-            p = t.find("={", p)
-            if -1 == p:
-                break
-            k = t[oldP:p].strip()
-            oldP = p + 2
-            p = self.findNextBracket(t, oldP)
-            if -1 == p:
-                break
-            res[k] = t[oldP:p]
-        return res
-
     def dumpC(self):
         cs = self.vw.page().networkAccessManager().cookieJar().cookiesForUrl(self.vw.url().toString())
         for c in cs:
             print c.name() + ";" + c.value()
 
-    def getBitTexUrls(self):
-        res = []
-        ls = self.vw.page().mainFrame().evaluateJavaScript("var arr= new Array();var elms=document.getElementsByTagName(\"a\");for (var i = 0; i < elms.length; i++){if(\"Import into BibTeX\" == elms[i].innerHTML){arr.push(elms[i].href);}}arr;")
-        if ls is not None:
-            for l in ls:
-                res.append(l)
-        return res
-
-    def getRelated(self):
-        res = []
-        ls = self.vw.page().mainFrame().evaluateJavaScript("var arr= new Array();var elms=document.getElementsByClassName(\"gs_fl\");for (var i = 0; i < elms.length; i++){if (elms[i].className == \"gs_fl\"){var elms1=elms[i].getElementsByTagName(\"a\");var s = arr.length;for (var j = 0; j < elms1.length; j++){if(elms1[j].innerHTML.indexOf(\"Related articles\") != -1){arr.push(elms1[j].href); found = 1; break;}}if (s == arr.length) arr.push(\"\");}};arr;")
-        if ls is not None:
-            for l in ls:
-                p = l.find("related:")
-                p0 = l.find(":", p + 8)
-                if p != -1 and p0 != -1:
-                    res.append(l[p + 8: p0])
-                else:
-                    res.append("")
-        return res
-
-    def getCitesInfo(self):
-        res = []
-        citedBy = self.vw.page().mainFrame().evaluateJavaScript("var arr= new Array();var elms=document.getElementsByClassName(\"gs_fl\");for (var i = 0; i < elms.length; i++){if (elms[i].className == \"gs_fl\"){var elms1=elms[i].getElementsByTagName(\"a\");var s = arr.length;for (var j = 0; j < elms1.length; j++){if(elms1[j].innerHTML.indexOf(\"Cited by\") != -1){arr.push(elms1[j].href); arr.push(elms1[j].innerHTML);found = 1; break;}}if (s == arr.length) {arr.push(\"\");arr.push(\"\");};}};arr;")
-
-        s = len(citedBy)
-        if citedBy is not None:
-            for i in xrange(0, s / 2):
-                p = citedBy[2 * i + 0].find('?cites=')
-                p0 = citedBy[2 * i + 0].find('&', p)
-                if p != -1 and p0 != -1:
-                    res.append((citedBy[2 * i + 0][p + 7:p0], citedBy[2 * i + 1][9:]))
-                else:
-                    res.append(("", "0"))
-        return res
-
     def evalJS(self):
         js = self.df.edt.toPlainText()
         if len(js) > 0:
@@ -382,10 +570,9 @@ class Citenet(QObject):
         self.start = 0
         self.win1.setEnabled(False)
         self.goto_more = True
-        self.ss = "stage0"
         if len(self.q) > 0:
             self.change_status('Loading top level page')
-            self.load_url("http://scholar.google.com/ncr")
+            self.start_session()
 
     def goto1(self):
         self.win2.lstCandidates.clear()
@@ -424,126 +611,40 @@ class Citenet(QObject):
         self.win2.statusbar.addWidget(self.status_label, 1)
         self.win2.show()
 
-    def quote_identifier(self, s, errors="strict"):
-        encodable = s.encode("utf-8", errors).decode("utf-8")
-        nul_index = encodable.find("\x00")
-        if nul_index >= 0:
-            error = UnicodeEncodeError("NUL-terminated utf-8", encodable, nul_index, nul_index + 1, "NUL not allowed")
-            error_handler = codecs.lookup_error(errors)
-            replacement, _ = error_handler(error)
-            encodable = encodable.replace("\x00", replacement)
-
-        return encodable.replace("\"", "\"\"")
-
-    def get_existing_pub_id(self, bib, title, author):
-        cur = self.dbcon.get_cursor()
-        pubid = ""
-
-        try:
-            # try (bibtexkey, title)
-            q = 'select pubid from publications where bibtexkey = \"%s\" and title = \"%s\";' % (bib, title)
-            cur.execute(q)
-            r = cur.fetchone()
-
-            # try (bibtexkey, title-without-quotes)
-            if r is None or len(r) == 0:
-                q = 'select pubid from publications where bibtexkey = \"%s\" and title = \"%s\";' % (bib, title.replace("''", "'"))
-                cur.execute(q)
-                r = cur.fetchone()
-
-            # try (bibtexkey, author)
-            if r is None or len(r) == 0:
-                q = 'select pubid from publications where bibtexkey = \"%s\" and author = \"%s\";' % (bib, author)
-                cur.execute(q)
-                r = cur.fetchone()
-
-            # publication was found
-            if r is not None and len(r) > 0:
-                pubid = r[0]
-
-        except sqlite3.Error, e:
-            logger.error("002: DB error %s:" % e.args[0])
-            logger.exception(e)
-            exit(-1)
-
-        return pubid
-
-    def save_publication(self, pub):
-        cur = self.dbcon.get_cursor()
-        pub["searchlevel"] = str(self.current_level)
-
-        for k, v in pub.items():
-            v = v.replace("'", "''")
-            pub[k] = self.quote_identifier(v)
-            continue
-
-        fix = dict()
-        fix["number"] = "num"
-
-        for k, v in pub.items():
-            if k in fix:
-                del pub[k]
-                pub[fix[k]] = v
-
-        good = ['bibtexkey', 'type', 'title', 'author', 'journal', 'volume', 'num', 'pages', 'year', 'publisher', 'cites', 'citedby', 'related', 'searchlevel']
-
-        for k, v in pub.items():
-            if k not in good:
-                del pub[k]
-
-        if pub["bibtexkey"] == 'gardner2010scholarly':
-            print "x"
-
-        new_pub = False
-        pubid = self.get_existing_pub_id(pub["bibtexkey"], pub["title"], pub["author"])
-        # publication was not found
-        if len(pubid) == 0:
-            pubid = pub['bibtexkey'] + ('_%010d' % (self.total_records))
-            new_pub = True
-
-        pub["pubid"] = pubid
-
-        try:
-            # add to publications
-            if (new_pub):
-                q = 'insert into publications(%s) values(%s);' % (",".join(pub.keys()), "'" + "','".join(pub.values()) + "'")
-                cur.execute(q)
-
-            # add to citationrelationship
-            if self.current_level > 0:
-                q = 'insert into citationrelationship(Citation_ID, Publication_ID) values("%s", "%s");' % (pubid, self.parent_bibtex)
-                cur.execute(q)
-
-            # commit
-            self.dbcon.commit()
-            # increase record count
-            if (new_pub):
-                self.total_records += 1
-        except sqlite3.Error, e:
-            logger.error(e)
-            logger.exception(e)
-
-            # roll back the transaction
-            self.dbcon.rollback()
-
+    def init_crawl(self):
+        '''
+        Start the search state for the current database, with an empty dedup
+        cache. Evicted cache entries are spilled to a file next to the
+        database if -dedupspill is given.
+        '''
+        if self.crawl is not None:
+            self.crawl.pub_cache.close()
+        spill_path = None
+        if "-dedupspill" in sys.argv:
+            spill_path = self.dbcon.filename + '.dedup'
+        self.crawl = Crawl(self.dbcon, int(get_arg("-dedupcache", 100000)),
+                           spill_path)
+
+    def save_publications(self, pubs, parent_done=False):
+        '''
+        Save a batch of publications found for the current parent, along with
+        the scrape progress
+        '''
+        self.crawl.rate_state = self.rate_control.state()
+        state = self.crawl.save_publications(pubs, self.current_level, self.parent,
+                                             self.progress, parent_done)
+        if state is None:
             return False
-
+        for k, v in state.items():
+            setattr(self, k, v)
+        if parent_done:
+            self.parent = None
         return True
 
     def create_db(self, path):
         try:
-            cur = self.dbcon.get_cursor()
-            cur.execute('drop table if exists header;')
-            cur.execute('drop table if exists citationrelationship;')
-            cur.execute('drop table if exists publications;')
-            cur.execute('create table header(key varchar(64), value varchar(64));')
-            cur.execute('create table CitationRelationship(Citation_ID text, Publication_ID text, primary key (Citation_ID, Publication_ID));')
-            # cur.execute('create table Publications(bibtexkey varchar(64), type varchar(16), title varchar(256), author varchar(128), journal varchar(64), booktitle varchar(64), volume varchar(16), number varchar(16), pages varchar(16), year varchar(16), publisher varchar(64), organization varchar(32), institution varchar(64), school varchar(64), cites varchar(32), citedby varchar(16), searchlevel varchar(16));')
-            cur.execute('create table Publications (BibtexKey text, PubID text, Type text, Title text, Author text, Journal text, Volume integer, Num integer, Pages text, Year integer, Publisher text, Cites text, CitedBy integer, Related text, SearchLevel integer, primary key (BibtexKey, Title))')
-
-            self.current_level = 0
             header = dict()
-            header["query"] = self.quote_identifier(self.q)
+            header["query"] = self.q
             header["ppl"] = self.win3.edtPercentPerLevel.text()
             header["max_number"] = self.win3.edtPercentPerLevel.text()
             header["maxpl"] = self.win3.edtMaxPerLevel.text()
@@ -558,17 +659,9 @@ class Citenet(QObject):
             else:
                 header["use_percent"] = "0"
 
-            for p in self.seedPapers:
-                try:
-                    self.save_publication(p)
-                except Exception as e:
-                    logger.error('%s Error saving publication "%s"' % (datetime.now(), p))
-                    logger.exception(e)
+            header["policy"] = self.get_policy() or DEFAULT_POLICY
 
-            for k, v in header.items():
-                q = 'insert into header(key, value) values("%s",  "%s");' % (str(k), str(v))
-                cur.execute(q)
-            self.dbcon.commit()
+            self.crawl.create(header, self.seedPapers)
             self.current_level = 1
             self.scrape_done = False
             self.was_paused = False
@@ -581,27 +674,19 @@ class Citenet(QObject):
         return True
 
     def continue_data_collection(self):
-        cur = self.dbcon.get_cursor()
-
         try:
-            cur.execute("SELECT value FROM header WHERE key = 'ppl'")
-            self.ppl = int(cur.fetchone()[0])
-            cur.execute("SELECT value FROM header WHERE key = 'max_level'")
-            self.max_level = int(cur.fetchone()[0])
-            cur.execute("SELECT value FROM header WHERE key = 'current_level'")
-            self.current_level = int(cur.fetchone()[0])
-            cur.execute("SELECT value FROM header WHERE key = 'current_row'")
-            self.current_row = int(cur.fetchone()[0])
-            cur.execute("SELECT value FROM header WHERE key = 'progress'")
-            self.progress = int(cur.fetchone()[0])
-            cur.execute("SELECT value FROM header WHERE key = 'use_percent'")
-            self.use_percent = int(cur.fetchone()[0]) == 1
-            cur.execute("SELECT value FROM header WHERE key = 'maxpl'")
-            self.maxpl = int(cur.fetchone()[0])
-            cur.execute("SELECT value FROM header WHERE key = 'level_limit'")
-            self.level_limit = int(cur.fetchone()[0])
-            cur.execute("SELECT value FROM header WHERE key = 'scrape_done'")
-            self.scrape_done = int(cur.fetchone()[0]) == 1
+            header = self.crawl.load(self.get_policy())
+            self.max_level = self.crawl.max_level
+            self.current_level = int(header['current_level'])
+            self.current_row = int(header['current_row'])
+            self.progress = int(header['progress'])
+            self.level_limit = int(header['level_limit'])
+            self.scrape_done = self.crawl.scrape_done
+            self.parent = None
+
+            # continue at the rate learned on previous sessions
+            self.rate_control.restore(header)
+            self.backend.throttle(self.rate_control)
 
         except sqlite3.Error, e:
             logger.error("1: DB error %s:" % e.args[0])
@@ -625,6 +710,7 @@ class Citenet(QObject):
         # initialize database
         self.dbcon = DBConnection(self.win3.edtDBname.text())
         self.dbcon.open()
+        self.init_crawl()
         if not self.create_db(self.dbcon.filename):
             QMessageBox.critical(self.win3, "Error", "Can not create db file.")
             self.dbcon = None
@@ -632,33 +718,19 @@ class Citenet(QObject):
 
         self.win3.setEnabled(False)
         self.from1 = False
+        # the seeds are chosen: a renewal of the session from now on goes
+        # back to the crawl (see session_ready), not to the search page
+        self.goto_more = False
         self.win4.show()
         self.win4.lblPaper.setText("")
         self.continue_data_collection()
 
-    def dump_scrape_progress(self):
-        cur = self.dbcon.get_cursor()
-        header = dict()
-
-        header["current_row"]   = str(self.current_row)
-        header["current_level"] = str(self.current_level)
-        header["progress"]      = str(self.progress)
-        header["level_limit"]   = str(self.level_limit)
-        if self.scrape_done:
-            header["scrape_done"] = "1"
-        else:
-            header["scrape_done"] = "0"
-
-        for k, v in header.items():
-            q = "update header set value = '%s' where key = '%s';" % (str(v), str(k))
-            cur.execute(q)
-
-        self.dbcon.commit()
-
     def stop_scrape(self):
         self.change_status('Search stopped manually')
         self.was_paused = True
-        self.dbcon.close()
+        self.delay_timer.stop()
+        self.status_before_delay = None
+        self.crawl.close()
 
         # return to original state
         self.win3.setEnabled(True)
@@ -672,7 +744,7 @@ class Citenet(QObject):
         self.goto_0_from_3()
 
     def do_resume_search(self):
-        if self.working or self.win1.isVisible() or self.win2.isVisible():
+        if self.working or self.shown('win1') or self.shown('win2'):
             return
         try:
             if self.dbcon is not None:
@@ -680,12 +752,8 @@ class Citenet(QObject):
                 self.dbcon.close()
             self.dbcon = DBConnection(self.sdb)
             self.dbcon.open()
-
-            # count the number of articles already on DB
-            cur = self.dbcon.get_cursor()
-            cur.execute('select count(rowid) from publications;')
-            self.total_records = int(cur.fetchone()[0])
-            logger.info(self.total_records)
+            self.init_crawl()
+            self.crawl.open()
 
         except sqlite3.Error, _:
             QMessageBox.critical(self.win1, "Error", "Invalid db file, can not resume search")
@@ -695,9 +763,35 @@ class Citenet(QObject):
         settings.setValue("lastdb", self.sdb)
 
         self.goto_more = False
-        self.ss = "stage0"
         self.change_status('Resuming search')
-        self.load_url("http://scholar.google.com/ncr")
+        self.start_session()
+
+    def start_session(self):
+        '''
+        Go through the settings handshake (stage0 to stage2), unless the
+        saved Scholar session is still valid
+        '''
+        if self.backend.session_valid():
+            logger.info('Reusing the saved Scholar session')
+            self.working = True
+            self.session_ready()
+        else:
+            self.ss = "stage0"
+            self.load_url("/ncr")
+
+    def session_ready(self):
+        self.change_status('Collecting data')
+        if not self.goto_more:
+            # continue resume search
+            self.win0.setEnabled(False)
+            self.from1 = True
+            self.win4.show()
+            self.win4.lblPaper.setText("")
+            self.was_paused = False
+            self.continue_data_collection()
+        else:
+            self.ss = "stage3"
+            self.load_url("/scholar?q=" + self.q + "&btnG=&hl=en&as_sdt=0,5")
 
     def resume_search(self):
         # update the delay values
@@ -705,7 +799,7 @@ class Citenet(QObject):
         self.TIMEOUT_BLOCK = self.win0.spinBlock.value()
         self.FORCE_DELAY = self.win0.checkDelay.isChecked()
 
-        self.sdb = QFileDialog.getOpenFileName(self.win1, "Select db", "Select db to continue the search")[0]
+        self.sdb = QFileDialog.getOpenFileName(self.win0, "Select db", "Select db to continue the search")[0]
         if self.sdb is None or len(self.sdb) == 0:
             return
         self.working = False
@@ -744,9 +838,10 @@ class Citenet(QObject):
                 logger.warning("Warning: progress could not be updated")
                 logger.exception(e)
 
-    def dump_papers_to_db(self):
+    def dump_papers_to_db(self, parent_done=False):
         '''
-        Dump the pending articles to the database
+        Dump the pending articles to the database, along with the scrape
+        progress
         '''
         try:
             # update status and force redraw
@@ -754,15 +849,7 @@ class Citenet(QObject):
             logger.info("Writing %i articles into the DB" % len(self.to_be_dumped))
             app.processEvents()
 
-            for d in self.to_be_dumped:
-                try:
-                    self.save_publication(d)
-                except Exception as e:
-                    logger.error('%s Error saving publication "%s"' % (datetime.now(), d))
-                    logger.error(d)
-                    logger.exception(e)
-
-            self.dump_scrape_progress()
+            self.save_publications(self.to_be_dumped, parent_done)
 
         except sqlite3.Error, e:
             logger.error("2: DB error %s:" % e.args[0])
@@ -771,29 +858,15 @@ class Citenet(QObject):
 
     def dump_papers(self):
         try:
-            self.dbcon.open()
-
             # update status and force redraw
             self.change_status('Adding publications to the DB queue')
             app.processEvents()
 
-            cur = self.dbcon.get_cursor()
-            q = 'SELECT citedby FROM publications WHERE rowid = %s' % (str(self.current_row + 1))
-            cur.execute(q)
-
-            if self.use_percent:
-                r = cur.fetchone()
-                max_progress = int((int(r[0]) * self.ppl) / 100)
-                # cite at least one article
-                if max_progress == 0 and r[0] > 0:
-                    max_progress = 1
-            else:
-                max_progress = self.maxpl
+            max_progress = self.parent_max_progress
 
             i = 0
-            for p in self.lpPapers:
+            for d in self.lpPapers:
                 try:
-                    d = self.bibtex2dic(p)
                     d["cites"] = self.lpCites[i][0]
                     d["citedby"] = self.lpCites[i][1]
                     d["related"] = self.lpRelated[i]
@@ -804,26 +877,19 @@ class Citenet(QObject):
                     logger.error(d)
                     logger.exception(e)
 
-                self.progress += 1
                 i += 1
-                if self.progress >= max_progress:
-                    break
 
-            # all the articles for this paper have been retrieved
-            if self.progress >= max_progress or (i < 10 and self.progress < max_progress):
-                # dump the publications to the db
-                self.dump_papers_to_db()
-                self.to_be_dumped = []
+            # the progress is the offset of the next page: it counts every
+            # result listed, imported or not
+            self.progress += self.lpListed
 
-                self.progress = 0
-                self.current_row += 1
-                if self.current_row == self.level_limit:
-                    cur.execute('select count(rowid) from publications;')
-                    self.level_limit = int(cur.fetchone()[0])
-                    self.current_level += 1
-
-            self.scrape_done = self.current_level == self.max_level
-            self.dbcon.close()
+            # all the articles for this paper have been retrieved (a short
+            # page is the last one)
+            if self.progress >= max_progress or self.lpListed < self.page_size:
+                # dump the publications to the db, moving on to the next
+                # parent in the same transaction
+                self.dump_papers_to_db(parent_done=True)
+                self.to_be_dumped = []
 
         except sqlite3.Error, e:
             logger.error("2: DB error %s:" % e.args[0])
@@ -831,18 +897,22 @@ class Citenet(QObject):
             return
 
         if self.scrape_done:
-            # return to initial dialog when search is completed
-            self.win4.hide()
-            QMessageBox.information(self.win3, "Great!", "DB is created")
-            self.win3.hide()
-            self.win0.setEnabled(True)
-            self.goto_0_from_3()
+            self.scrape_finished()
         else:
             if self.was_paused:
                 self.was_paused = False
             else:
                 self.do_continue_data_collection()
 
+    def scrape_finished(self):
+        # return to initial dialog when search is completed
+        self.crawl.close()
+        self.win4.hide()
+        QMessageBox.information(self.win3, "Great!", "DB is created")
+        self.win3.hide()
+        self.win0.setEnabled(True)
+        self.goto_0_from_3()
+
     def get_short_desc(self, d):
         l = []
         lr = ["title", "author", "year"]
@@ -853,8 +923,7 @@ class Citenet(QObject):
 
     def add_more_results(self):
         i = 0
-        for p in self.lpPapers:
-            d = self.bibtex2dic(p)
+        for d in self.lpPapers:
             n = self.get_short_desc(d)
             n = "%s, cited %s times" % (n, self.lpCites[i][1])
             self.win2.lstCandidates.addItem(n)
@@ -882,41 +951,60 @@ class Citenet(QObject):
         self.win2.lstArticles.takeItem(r)
 
     def mrcd(self):
-        # calculate max_progress the same way is done inside dump_papers
+        self.current_max_progress = self.parent_max_progress
+        self.loadPapers(self.dump_papers)
+
+    def next_parent(self):
+        '''
+        Take the next publication from the frontier as the current parent.
+        Returns False if there is none left.
+        '''
         try:
-            self.dbcon.open()
-            cur = self.dbcon.get_cursor()
-            q = 'SELECT citedby FROM publications WHERE rowid = %s' % (str(self.current_row + 1))
-            cur.execute(q)
-            if self.use_percent:
-                r = cur.fetchone()
-                max_progress = int((int(r[0]) * self.ppl) / 100)
-                # cite at least one article
-                if max_progress == 0 and r[0] > 0:
-                    max_progress = 1
-            else:
-                max_progress = self.maxpl
-            self.dbcon.close()
+            r = self.crawl.next_parent()
         except sqlite3.Error, e:
             logger.error("2: DB error %s:" % e.args[0])
             logger.exception(e)
-            return
+            return False
 
-        self.current_max_progress = max_progress
-        self.loadPapers(self.dump_papers)
+        if r is None:
+            self.scrape_done = self.crawl.scrape_done
+            return False
+
+        self.parent, pub = r
+        self.citeid = pub[0]
+        self.parent_max_progress = self.crawl.max_progress(pub[4])
+        self.parent_bibtex = self.parent.pubid
+        self.progress = self.parent.offset
+        logger.info('%d of %s citations to collect in %d pages' %
+                    (self.parent_max_progress - self.progress, pub[4] or 0,
+                     self.crawl.pages(pub[4], self.progress)))
+        self.current_level = self.parent.level + 1
+        self.current_row, self.level_limit = self.crawl.frontier.level_progress(self.parent.level)
+        return True
 
     def do_continue_data_collection(self):
-        self.dbcon.open()
-        cur = self.dbcon.get_cursor()
-        cur.execute('SELECT cites, bibtexkey, title, author FROM publications WHERE rowid = %s' % (str(self.current_row + 1)))
-        r = cur.fetchone()
-        self.citeid = r[0]
-        self.parent_bibtex = self.get_existing_pub_id(r[1], r[2], r[3])
-        self.dbcon.close()
+        while True:
+            if self.parent is None and not self.next_parent():
+                if self.scrape_done:
+                    self.scrape_finished()
+                return
+            if self.citeid and self.progress < self.parent_max_progress:
+                break
+            # nothing to load for this parent
+            if not self.save_publications([], parent_done=True):
+                # the database can not be written: stop instead of taking
+                # the same parent again and again
+                logger.error('Can not save the progress on %s, search stopped' % self.parent.pubid)
+                self.change_status('Database error - search stopped', red=True)
+                self.parent = None
+                self.working = False
+                return
 
         self.ss = "next"
         self.doNext = self.mrcd
-        url = "http://scholar.google.com/scholar?cites=%s&as_sdt=2005&sciodt=0,5&num=100&hl=en&start=%s" % (self.citeid, self.progress)
+        # request exactly the citations still needed
+        self.page_size = page_size(self.progress, self.parent_max_progress)
+        url = cites_url(self.citeid, self.progress, self.parent_max_progress)
         self.change_status('Continuing data collection')
         self.load_url(url)
 
@@ -928,16 +1016,25 @@ class Citenet(QObject):
         self.ss = "next"
         self.doNext = self.mrmp
         self.start += 10
-        self.load_url("http://scholar.google.com/scholar?q=" + self.q + "&btnG=&hl=en&as_sdt=0,5&start=" + str(self.start))
+        self.load_url("/scholar?q=" + self.q + "&btnG=&hl=en&as_sdt=0,5&start=" + str(self.start))
 
     def loadPapers(self, end):
-        self.lpList = self.getBitTexUrls()
-        self.lpCites = self.getCitesInfo()
-        self.lpRelated = self.getRelated()
-
-        self.lpCurr = 0
-        self.lpEnd = end
-        self.lpPapers = []
+        metrics.count('result_pages')
+        if self.page.bibtex_lost and not self.renewing_session:
+            # the saved session lost the BibTeX preference: renew it, and
+            # go on from the progress stored
+            logger.warning('No BibTeX links found, renewing the Scholar session')
+            self.renewing_session = True
+            if self.to_be_dumped:
+                self.dump_papers_to_db()
+                self.to_be_dumped = []
+            self.backend.reset_session()
+            self.backend.forget(self.last_url)
+            self.ss = "stage0"
+            self.load_url("/ncr")
+            return
+        self.renewing_session = False
+        results = self.page.results
 
         # limit the list of results, discarding those over the limit
         progress = 0
@@ -945,13 +1042,25 @@ class Citenet(QObject):
             progress = self.progress
 
         if self.current_max_progress > 0:
-            self.lpList = self.lpList[:self.current_max_progress-progress+1]
-            self.lpCites = self.lpCites[:self.current_max_progress-progress+1]
-            self.lpRelated = self.lpRelated[:self.current_max_progress-progress+1]
+            results = results[:self.current_max_progress-progress]
+
+        # results listed, including the ones without a BibTeX link, which
+        # can not be imported
+        self.lpListed = len(results)
+        results = [r for r in results if r.bibtex_url]
+        self.lpList = [r.bibtex_url for r in results]
+        self.lpCites = [(r.cites, r.citedby) for r in results]
+        self.lpRelated = [r.related for r in results]
+
+        self.lpCurr = 0
+        self.lpEnd = end
+        self.lpPapers = []
 
-        self.lpOrigURL = self.vw.url().toString()
         if len(self.lpList) == 0:
             self.lpEnd()
+        elif self.backend.concurrent:
+            self.ss = "load_papers"
+            self.load_urls(self.lpList)
         else:
             self.ss = "load_papers"
             self.load_url(self.lpList[0])
@@ -962,6 +1071,7 @@ class Citenet(QObject):
             self.working = False
             self.timeout_retry_timer.stop()
             self.error_timer.stop()
+            self.delay_timer.stop()
             return
 
         # retry if a timeout/network error was detected
@@ -984,18 +1094,17 @@ class Citenet(QObject):
             self.change_status('Search resumed manually')
 
         # detect captcha/block
-        invalid_request = self.detect_captcha(self.vw.page().mainFrame())
+        invalid_request = self.detect_captcha(self.page)
 
         if invalid_request:
             self.working = False
+            self.batch = None
 
             # dump the pending publications to the db
             if self.to_be_dumped:
                 previous_status = self.status_label.text()[8:]
-                self.dbcon.open()
                 self.dump_papers_to_db()
                 self.to_be_dumped = []
-                self.dbcon.close()
                 self.change_status(previous_status, True)
 
             # clear cookies
@@ -1004,7 +1113,8 @@ class Citenet(QObject):
             #    self.ss = 'stage0'
             return
 
-        self.vw.hide()
+        if self.vw is not None:
+            self.vw.hide()
         self.working = True
         if ok:
             if self.ss == "stage0":
@@ -1021,44 +1131,35 @@ class Citenet(QObject):
                 }")
                 self.ss = "stage0"""
                 self.ss = "stage1"
-                self.load_url("http://scholar.google.com/scholar_settings?hl=en&as_sdt=0,5")
+                self.load_url(SETTINGS_URL)
             elif self.ss == "stage1":
                 self.change_status('Retrieving seed articles')
-                self.vw.page().mainFrame().evaluateJavaScript("var ch=document.getElementById(\"scis1\");ch.checked=true;")
-                self.vw.page().mainFrame().evaluateJavaScript("var e=document.getElementsByTagName(\"button\");for (var i = 0; i<e.length;i++){if ((e[i].getAttribute(\"class\").indexOf(\"gs_btn_act\") != -1) && (e[i].getAttribute(\"name\") == \"save\")){e[i].click();break;}}")
                 self.ss = "stage2"
+                self.backend.submit_settings(self.page)
             elif self.ss == "stage2":
-                self.change_status('Collecting data')
-                if not self.goto_more:
-                    # continue resume search
-                    self.win0.setEnabled(False)
-                    self.from1 = True
-                    self.win4.show()
-                    self.win4.lblPaper.setText("")
-                    self.was_paused = False
-                    self.continue_data_collection()
-                else:
-                    self.ss = "stage3"
-                    self.load_url("http://scholar.google.com/scholar?q=" + self.q + "&btnG=&hl=en&as_sdt=0,5")
+                self.backend.save_session()
+                self.session_ready()
 
             elif self.ss == "stage3":
                 self.current_max_progress = 0
                 self.loadPapers(self.dogoto2)
             elif self.ss == "load_papers":
-                self.lpPapers.append(self.vw.page().mainFrame().toPlainText())
+                pages = self.batch or [self.page]
+                self.batch = None
+                # each entry is parsed once, as soon as it is loaded
+                metrics.count('bibtex_entries', len(pages))
+                for page in pages:
+                    with metrics.timer('bibtex'):
+                        self.lpPapers.append(bibtex.parse(page.text))
                 if len(self.lpPapers):
-                    self.win4.lblPaper.setText(self.get_short_desc(self.bibtex2dic(self.lpPapers[-1])))
+                    self.win4.lblPaper.setText(self.get_short_desc(self.lpPapers[-1]))
                     self.update_progress()
-                self.lpCurr += 1
+                self.lpCurr += len(pages)
                 # print self.lpCurr
-                if self.lpCurr == len(self.lpList):  # or \
-                    # (self.current_max_progress > 0 and self.lpCurr > self.current_max_progress):
-                    self.ss = "load_orig"
-                    self.load_url(self.lpOrigURL)
+                if self.lpCurr == len(self.lpList):
+                    self.lpEnd()
                 else:
                     self.load_url(self.lpList[self.lpCurr])
-            elif self.ss == "load_orig":
-                self.lpEnd()
             elif self.ss == "next":
                 self.doNext()
 
@@ -1067,110 +1168,192 @@ class Citenet(QObject):
         pass
 
     def toggle_web(self):
-        self.vw.setVisible(not self.vw.isVisible())
+        if self.vw is not None:
+            self.vw.setVisible(not self.vw.isVisible())
 
     def toggle_log(self):
         self.winlog.setVisible(not self.winlog.isVisible())
 
     def copy_log_clipboard(self):
+        self.qt_handler.refresh()
         QApplication.clipboard().setText(self.winlog.txtLog.toPlainText())
 
-    def init_log_window(self):
-        # load the UI for the log window
-        loader = QUiLoader()
-        uifile = QFile(self.FORMS['logwindow.ui'])
+    def init_logging(self):
+        '''
+        Log to the console, the log window and a rotating log file (the
+        urls requested go to the file only). The records are handled on a
+        separate thread; the log window is only built when first shown,
+        the messages logged until then are kept by its handler.
+        '''
+        # nice output format
+        formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(message)s')
+        self.qt_handler = QTLogHandler()
+        stderr_log_handler = logging.StreamHandler()
+        handlers = [self.qt_handler, stderr_log_handler]
+        for handler in handlers:
+            handler.setLevel(logging.INFO)
+
+        error = None
+        if "-nologfile" not in sys.argv:
+            path = get_arg("-logfile", logpipe.DEFAULT_PATH)
+            try:
+                handlers.append(logpipe.GzipRotatingFileHandler(
+                    path, maxBytes=int(get_arg("-logsize", 10))*1024*1024, backupCount=5))
+            except IOError, e:
+                error = 'Can not write the log to %s: %s' % (path, e)
+
+        for handler in handlers:
+            handler.setFormatter(formatter)
+        self.log_listener = logpipe.start(logger, handlers)
+        logger.setLevel(logging.DEBUG if len(handlers) > 2 else logging.INFO)
+        if error is not None:
+            logger.warning(error)
+
+        # the log window is updated a few times per second at most
+        self.log_timer = QTimer()
+        self.connect(self.log_timer, SIGNAL("timeout()"), self.qt_handler.refresh)
+        self.log_timer.start(250)
+
+    def load_form(self, filename):
+        '''
+        Window described in one of the .ui files of the resources folder
+        '''
+        uifile = QFile(os.path.join(RESOURCES, filename))
         uifile.open(QFile.ReadOnly)
-        self.winlog = loader.load(uifile, None)
+        win = QUiLoader().load(uifile, None)
         uifile.close()
+        win.btnVis.clicked.connect(self.toggle_web)
+        win.btnLog.clicked.connect(self.toggle_log)
+        return win
 
-        # connect slots
-        self.winlog.btnCopy.clicked.connect(self.copy_log_clipboard)
-        self.winlog.btnHide.clicked.connect(self.toggle_log)
-        # self.winlog.show()
-
-        # init logging system
-        qt_handler = QTLogHandler(self.winlog.txtLog)
-        logger.addHandler(qt_handler)
+    def shown(self, name):
+        '''
+        Whether a window has been built and is visible
+        '''
+        return name in self.__dict__ and self.__dict__[name].isVisible()
 
-        stderr_log_handler = logging.StreamHandler()
-        logger.addHandler(stderr_log_handler)
+    def built_windows(self):
+        '''
+        The windows built so far, without building the others
+        '''
+        return [self.__dict__[name] for name in ('win0', 'win1', 'win2', 'win3', 'win4')
+                if name in self.__dict__]
+
+    # the windows other than the first one are built on first use
+
+    @lazy
+    def win1(self):
+        win = self.load_form('form1.ui')
+        win.edtNumber.setValidator(QIntValidator(1, 10000000, self))
+        win.btnNextStep.clicked.connect(self.goto2)
+        win.btnResume.clicked.connect(self.go_from_0)
+        return win
+
+    @lazy
+    def win2(self):
+        win = self.load_form('form2.ui')
+        win.btnAdd.clicked.connect(self.add_article)
+        win.btnRemove.clicked.connect(self.remove_article)
+        win.btnNewKeywords.clicked.connect(self.goto1)
+        win.btnMoreResults.clicked.connect(self.more_results)
+        win.btnNextStep.clicked.connect(self.goto3)
+        return win
+
+    @lazy
+    def win3(self):
+        win = self.load_form('form3.ui')
+        iv = QIntValidator(1, 100, self)
+        win.edtPercentPerLevel.setValidator(iv)
+        win.edtPercentPerLevel.setText("3")
+        win.edtMaxPerLevel.setValidator(iv)
+        win.edtMaxPerLevel.setText("3")
+        win.edtMaxLevel.setText("3")
+        win.edtDBname.setText("result.sqlite")
+        win.edtMaxLevel.setValidator(iv)
+        win.btnBegin.clicked.connect(self.begin_data_collection)
+        win.btnPrev.clicked.connect(self.prev_page_from_3)
+        win.btnCancel.clicked.connect(self.goto_0_from_3)
+        return win
+
+    @lazy
+    def win4(self):
+        win = self.load_form('progress.ui')
+        win.btnStopScrape.clicked.connect(self.stop_scrape)
+        win.setWindowFlags(Qt.CustomizeWindowHint | Qt.WindowTitleHint)
+        win.statusbar.addWidget(self.status_label_prog, 1)
+        return win
+
+    @lazy
+    def winlog(self):
+        uifile = QFile(os.path.join(RESOURCES, 'logwindow.ui'))
+        uifile.open(QFile.ReadOnly)
+        win = QUiLoader().load(uifile, None)
+        uifile.close()
+        win.btnCopy.clicked.connect(self.copy_log_clipboard)
+        win.btnHide.clicked.connect(self.toggle_log)
+        self.qt_handler.set_dest(win.txtLog)
+        return win
 
-        # nice output format
-        formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(message)s')
-        qt_handler.setFormatter(formatter)
-        stderr_log_handler.setFormatter(formatter)
-        logger.setLevel(logging.INFO)
+    def get_policy(self):
+        '''
+        Frontier prioritization policy given with -policy, if any
+        '''
+        policy = get_arg("-policy")
+        if policy is not None and policy not in POLICIES:
+            logger.warning('Unknown policy "%s"' % policy)
+            policy = None
+        return policy
+
+    @lazy
+    def backend(self):
+        '''
+        Page loader, created on the first request. Pages are fetched over
+        plain HTTP unless -webkit is given, in which case they are rendered
+        on a QWebView.
+        '''
+        base_url = get_arg("-scholarurl", SCHOLAR_URL)
+        if "-webkit" in sys.argv:
+            backend = WebKitBackend(base_url)
+            backend.view.loadProgress.connect(self.loadProgress)
+        else:
+            cache = None
+            if "-nocache" not in sys.argv:
+                cache = ResponseCache(get_arg("-cache", DEFAULT_PATH),
+                                      ttl=float(get_arg("-cachettl", 30))*24*3600,
+                                      max_size=int(get_arg("-cachesize", 256))*1024*1024)
+            cookies = None
+            if "-nocookies" not in sys.argv:
+                cookies = get_arg("-cookies", COOKIES_PATH)
+            backend = HTTPBackend(base_url, max_in_flight=int(get_arg("-inflight", 4)),
+                                  rate=float(get_arg("-rate", 1)),
+                                  cache=cache, offline="-offline" in sys.argv,
+                                  cookies=cookies)
+            backend.finished_many.connect(self.pages_loaded)
+        backend.finished.connect(self.page_loaded)
+        backend.throttle(self.rate_control)
+        return backend
+
+    @property
+    def vw(self):
+        backend = self.__dict__.get('backend')
+        return backend.view if backend is not None else None
 
     def __init__(self):
 
         QObject.__init__(self)
-        loader = QUiLoader()
-
-        # init forms
-        for filename in pkg_resources.resource_listdir('citenet', 'resources'):
-            self.FORMS[filename] = \
-                pkg_resources.resource_filename('citenet',
-                                                os.path.join('resources', filename))
 
-        uifile = QFile(self.FORMS['form0.ui'])
-        uifile.open(QFile.ReadOnly)
-        self.win0 = loader.load(uifile, None)
-        uifile.close()
-        uifile = QFile(self.FORMS['form1.ui'])
-        uifile.open(QFile.ReadOnly)
-        self.win1 = loader.load(uifile, None)
-        uifile.close()
-        uifile = QFile(self.FORMS['form2.ui'])
-        uifile.open(QFile.ReadOnly)
-        self.win2 = loader.load(uifile, None)
-        uifile.close()
-        uifile = QFile(self.FORMS['form3.ui'])
-        uifile.open(QFile.ReadOnly)
-        self.win3 = loader.load(uifile, None)
-        uifile.close()
-        uifile = QFile(self.FORMS['progress.ui'])
-        uifile.open(QFile.ReadOnly)
-        self.win4 = loader.load(uifile, None)
-        uifile.close()
-        iv = QIntValidator(1, 10000000, self)
-        self.win1.edtNumber.setValidator(iv)
-        iv = QIntValidator(1, 100, self)
-        self.win0.btnVis.clicked.connect(self.toggle_web)
-        self.win1.btnVis.clicked.connect(self.toggle_web)
-        self.win2.btnVis.clicked.connect(self.toggle_web)
-        self.win3.btnVis.clicked.connect(self.toggle_web)
-        self.win4.btnVis.clicked.connect(self.toggle_web)
-        self.win0.btnLog.clicked.connect(self.toggle_log)
-        self.win1.btnLog.clicked.connect(self.toggle_log)
-        self.win2.btnLog.clicked.connect(self.toggle_log)
-        self.win3.btnLog.clicked.connect(self.toggle_log)
-        self.win4.btnLog.clicked.connect(self.toggle_log)
-        self.win3.edtPercentPerLevel.setValidator(iv)
-        self.win3.edtPercentPerLevel.setText("3")
-        self.win3.edtMaxPerLevel.setValidator(iv)
-        self.win3.edtMaxPerLevel.setText("3")
-        self.win3.edtMaxLevel.setText("3")
-        self.win3.edtDBname.setText("result.sqlite")
-        self.win3.edtMaxLevel.setValidator(iv)
-        self.win1.btnNextStep.clicked.connect(self.goto2)
-        self.win1.btnResume.clicked.connect(self.go_from_0)
+        # only the first window is built now
+        self.win0 = self.load_form('form0.ui')
         self.win0.btnResume.clicked.connect(self.resume_search)
-        self.vw = QWebView()
-        self.vw.loadFinished.connect(self.loadFinished)
-        self.vw.loadProgress.connect(self.loadProgress)
         self.win0.btnNewSearch.clicked.connect(self.goto0)
-        self.win2.btnAdd.clicked.connect(self.add_article)
-        self.win2.btnRemove.clicked.connect(self.remove_article)
-        self.win2.btnNewKeywords.clicked.connect(self.goto1)
-        self.win2.btnMoreResults.clicked.connect(self.more_results)
-        self.win2.btnNextStep.clicked.connect(self.goto3)
-        self.win3.btnBegin.clicked.connect(self.begin_data_collection)
-        self.win3.btnPrev.clicked.connect(self.prev_page_from_3)
-        self.win3.btnCancel.clicked.connect(self.goto_0_from_3)
-        self.win4.btnStopScrape.clicked.connect(self.stop_scrape)
-        self.win4.setWindowFlags(Qt.CustomizeWindowHint | Qt.WindowTitleHint)
-
-        self.init_log_window()
+        self.rate_control = RateController(float(get_arg("-rate", 1)),
+                                           int(get_arg("-inflight", 4)))
+        self.batch = None
+        self.renewing_session = False
+
+        self.init_logging()
+        self.metrics = metrics.Reporter(get_arg("-metrics"), get_arg("-metricsport"),
+                                        get_arg("-metricsinterval", 10))
 
         # if False:
         #    file = QFile("form_d.ui")
@@ -1190,6 +1373,8 @@ class Citenet(QObject):
         if "-forcedelay" in sys.argv:
             logger.info('Delay enabled')
             self.FORCE_DELAY = True
+        self.SIMULATED_CAPTCHA = "-simcaptcha" in sys.argv
+        self.SIMULATED_BLOCK = "-simblock" in sys.argv
 
         self.win0.spinCaptcha.setValue(self.TIMEOUT_CAPTCHA)
         self.win0.spinBlock.setValue(self.TIMEOUT_BLOCK)
@@ -1200,25 +1385,15 @@ class Citenet(QObject):
         # add status bar widget
         self.init_status()
         self.win0.statusbar.addWidget(self.status_label, 1)
-        self.win4.statusbar.addWidget(self.status_label_prog, 1)
         self.change_status('Idle')
 
         # change to home directory (My Documents)
-        try:
-            import ctypes.wintypes
-            CSIDL_PERSONAL = 5       # My Documents
-            SHGFP_TYPE_CURRENT = 1   # Get current, not default value
-
-            buf = ctypes.create_unicode_buffer(ctypes.wintypes.MAX_PATH)
-            ctypes.windll.shell32.SHGetFolderPathW(None, CSIDL_PERSONAL, None,
-                                                   SHGFP_TYPE_CURRENT, buf)
-            current_dir = buf.value
-        except:
-            current_dir = os.path.expanduser('~')
-        os.chdir(current_dir)
+        os.chdir(documents_dir())
 
         # database
         self.dbcon = None
+        self.crawl = None
+        self.parent = None
 
         if len(sys.argv) > 1:
             if sys.argv[1] == "-resumelast":
@@ -1241,4 +1416,6 @@ if __name__ == "__main__":
     if s.dbcon is not None:
         s.dbcon.commit()
         s.dbcon.close()
+    s.metrics.close()
+    s.log_listener.stop()
     sys.exit(r)
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+'''
+citenet - Citation Network Analyzer
+Copyright (C) 2015 Jesse Lecy <jdlecy@gmail.com>, with contributions from
+Diego Moreda <diego.plan9@gmail.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along
+with this program; if not, write to the Free Software Foundation, Inc.,
+51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+Command line options shared by the application and the commands.
+'''
+
+import sys
+
+
+def get_arg(name, default=None):
+    '''
+    Value following a command line flag (-flag value)
+    '''
+    if name in sys.argv:
+        i = sys.argv.index(name)
+        if i + 1 < len(sys.argv):
+            return sys.argv[i + 1]
+    return default
@@ -0,0 +1,500 @@
+# -*- coding: utf-8 -*-
+'''
+citenet - Citation Network Analyzer
+Copyright (C) 2015 Jesse Lecy <jdlecy@gmail.com>, with contributions from
+Diego Moreda <diego.plan9@gmail.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along
+with this program; if not, write to the Free Software Foundation, Inc.,
+51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+'''
+
+from collections import OrderedDict
+from datetime import datetime
+import logging
+import sqlite3
+import time
+import urllib
+
+import bibtex
+from db import PUB_COLUMNS, dedup_key
+from dedup import DedupCache, author_key
+from fetcher import SCHOLAR_URL, FetchError, HTTPFetcher, NotCached, load_cookies
+from frontier import DEFAULT_POLICY, POLICIES, Frontier
+from ratecontrol import RateController
+import metrics
+import scraper
+
+logger = logging.getLogger('main')
+
+CITES_URL = "/scholar?cites=%s&as_sdt=2005&sciodt=0,5&num=%d&hl=en&start=%s"
+SETTINGS_URL = "/scholar_settings?hl=en&as_sdt=0,5"
+SEARCH_URL = "/scholar?q=%s&btnG=&hl=en&as_sdt=0,5&start=%s"
+
+# most results Scholar lists on a page of citations
+MAX_PAGE_SIZE = 100
+
+
+def page_size(offset, max_progress):
+    '''
+    Results to request on the next page of citations: only the ones still
+    needed, up to MAX_PAGE_SIZE
+    '''
+    return max(min(max_progress - offset, MAX_PAGE_SIZE), 1)
+
+
+def cites_url(cites, offset, max_progress):
+    return CITES_URL % (cites, page_size(offset, max_progress), offset)
+
+
+class Blocked(Exception):
+    '''
+    Scholar answered with a captcha, block or forbidden page
+    '''
+    def __init__(self, kind, page):
+        Exception.__init__(self, kind)
+        self.kind = kind
+        self.page = page
+
+
+class Crawl(object):
+    '''
+    A search stored in a result database: its settings (the header), its
+    frontier and the publications found so far. It does not retrieve any
+    page, so it is shared by the GUI and by the headless crawlers, and all
+    the writes of a search go through it.
+    '''
+    def __init__(self, dbcon, cache_size=100000, spill_path=None):
+        self.dbcon = dbcon
+        self.pub_cache = DedupCache(cache_size, spill_path)
+        self.frontier = None
+        self.total_records = 0
+        self.scrape_done = False
+        self.rate_state = dict()   # request rate to be stored with the progress
+
+    def close(self):
+        self.pub_cache.close()
+        self.dbcon.close()
+
+    def create(self, header, seeds):
+        '''
+        Create the result database of a new search from its header and seed
+        publications
+        '''
+        self.dbcon.create_schema()
+        self.max_level = int(header["max_level"])
+        self.frontier = Frontier(self.dbcon, self.max_level, header["policy"])
+        self.frontier.create()
+        self.save_publications(seeds, 0)
+        self.dbcon.insert_header(header)
+        self.dbcon.commit()
+
+    def open(self):
+        '''
+        Prepare an existing result database for resuming the search
+        '''
+        self.dbcon.upgrade_schema()
+        self.dbcon.commit()
+
+        # count the number of articles already on DB
+        self.total_records = self.dbcon.count_publications()
+        logger.info(self.total_records)
+        self.pub_cache.load(self.dbcon.get_cursor())
+
+    def load(self, policy=None):
+        '''
+        Read the search settings and set up the frontier, with the given
+        prioritization policy or the one stored. Returns the header.
+        '''
+        header = self.dbcon.read_header()
+        self.ppl = int(header['ppl'])
+        self.max_level = int(header['max_level'])
+        self.use_percent = int(header['use_percent']) == 1
+        self.maxpl = int(header['maxpl'])
+        self.scrape_done = int(header['scrape_done']) == 1
+
+        # databases from previous versions have no frontier yet
+        stored = header.get('policy')
+        if policy is not None and policy not in POLICIES:
+            logger.warning('Unknown policy "%s"' % policy)
+            policy = None
+        if policy is None:
+            policy = stored if stored in POLICIES else DEFAULT_POLICY
+        self.frontier = Frontier(self.dbcon, self.max_level, policy)
+        if not self.frontier.exists():
+            self.frontier.build(int(header['current_row']), int(header['progress']))
+        elif policy != stored:
+            self.frontier.reprioritize()
+        self.dbcon.set_header(dict(policy=policy))
+        self.dbcon.commit()
+        self.frontier.load()
+        return header
+
+    def max_progress(self, citedby):
+        '''
+        Number of citations to collect for a publication, never more than
+        the ones listed by Scholar
+        '''
+        try:
+            citedby = int(citedby or 0)
+        except ValueError:
+            citedby = 0
+        if self.use_percent:
+            max_progress = int((citedby * self.ppl) / 100)
+            # cite at least one article
+            if max_progress == 0 and citedby > 0:
+                max_progress = 1
+        else:
+            max_progress = self.maxpl
+        return min(max_progress, citedby)
+
+    def pages(self, citedby, progress=0):
+        '''
+        Pages of citations still to be loaded for a publication
+        '''
+        remaining = max(self.max_progress(citedby) - progress, 0)
+        return (remaining + MAX_PAGE_SIZE - 1) // MAX_PAGE_SIZE
+
+    def next_parent(self):
+        '''
+        Take the next publication from the frontier, as (frontier item,
+        (cites, bibtexkey, title, author, citedby)), or None if there is
+        nothing left to hand out. The search is marked as done once there
+        is no work left at all.
+        '''
+        with metrics.timer('frontier'):
+            item = self.frontier.next()
+            self.dbcon.commit()
+        if item is None:
+            if not self.frontier.has_work():
+                self.scrape_done = True
+                self.dbcon.update_header(dict(scrape_done=1))
+                self.dbcon.commit()
+            return None
+        return item, self.dbcon.get_publication(item.pubid)
+
+    def find_pub_id(self, bib, title, author):
+        '''
+        Id of an already stored publication, matched on the dedup key or on
+        (bibtexkey, author). The dedup cache is checked first, and the
+        database is only queried (in a single indexed query) if the cache
+        can not tell.
+        '''
+        key = dedup_key(bib, title)
+        pubid = self.pub_cache.find(key, bib, author)
+        if pubid is not None:
+            return pubid
+
+        metrics.count('dedup_queries')
+        with metrics.timer('dedup_query'):
+            pubid = self.dbcon.find_pub_id(bib, title, author)
+
+        # publication was found
+        if len(pubid) > 0:
+            self.pub_cache.add(key, bib, author, pubid)
+        return pubid
+
+    def publication_row(self, pub, level):
+        '''
+        Values of the Publications columns for a parsed bibtex entry
+        '''
+        row = dict()
+        for k, v in pub.items():
+            if k == "number":
+                k = "num"
+            if k in PUB_COLUMNS:
+                row[k] = v
+        row["searchlevel"] = str(level)
+        row["dedupkey"] = dedup_key(pub["bibtexkey"], pub["title"])
+        return row
+
+    def save_publications(self, pubs, level, parent=None, progress=0, parent_done=False):
+        '''
+        Save a batch of publications of a level, and their citation
+        relationship to the parent (a frontier item, None for the seeds), in
+        a single transaction together with the progress on the parent. If
+        the batch can not be written, the publications are written one by
+        one so a single bad entry does not lose the rest.
+
+        Returns the scrape progress to be shown, or None on failure.
+        '''
+        items = []
+        pending = dict()
+        new_pubs = 0
+        for pub in pubs:
+            try:
+                row = self.publication_row(pub, level)
+                keys = (row["dedupkey"], author_key(row["bibtexkey"], row["author"]))
+                pubid = pending.get(keys[0]) or pending.get(keys[1]) or \
+                    self.find_pub_id(row["bibtexkey"], row["title"], row["author"])
+            except Exception as e:
+                logger.error('%s Error saving publication "%s"' % (datetime.now(), pub))
+                logger.exception(e)
+                continue
+
+            # publication was not found
+            if len(pubid) == 0:
+                pubid = row['bibtexkey'] + ('_%010d' % (self.total_records + new_pubs))
+                row["pubid"] = pubid
+                new_pubs += 1
+                pending[keys[0]] = pubid
+                pending.setdefault(keys[1], pubid)
+            else:
+                row = None
+            items.append((row, pubid))
+
+        state = self.write_publications(items, level, parent, progress, parent_done)
+        if state is not None:
+            return state
+
+        if len(items) > 1:
+            logger.warning('Writing the publications one by one')
+            for item in items:
+                self.write_publications([item], level, parent, progress)
+            return self.write_publications([], level, parent, progress, parent_done)
+        return None
+
+    def write_publications(self, items, level, parent=None, progress=0, parent_done=False):
+        '''
+        Insert (row, pubid) items and advance the progress on the parent,
+        all in the same transaction. Rows are None for publications already
+        stored.
+        '''
+        rows = [row for row, pubid in items if row is not None]
+
+        start = time.time()
+        try:
+            # add to publications
+            self.dbcon.insert_publications(rows)
+
+            # add to citationrelationship
+            if parent is not None:
+                self.dbcon.insert_citations([(pubid, parent.pubid) for row, pubid in items])
+
+            # queue the new publications for collecting their citations
+            self.frontier.push([(row["pubid"], level, row.get("citedby")) for row in rows])
+
+            state = dict()
+            if parent is not None:
+                state = self.parent_progress(parent, level, progress, parent_done)
+                header = dict(state)
+                header["scrape_done"] = int(state["scrape_done"])
+                header.update(self.rate_state)
+                self.dbcon.set_header(header)
+
+            # commit
+            self.dbcon.commit()
+        except sqlite3.Error, e:
+            logger.error(e)
+            logger.exception(e)
+
+            # roll back the transaction
+            self.dbcon.rollback()
+            self.frontier.load()
+
+            return None
+        metrics.observe('db_write', time.time() - start)
+        metrics.count('publications_inserted', len(rows))
+        metrics.count('publications_duplicate', len(items) - len(rows))
+
+        # increase record count
+        for row in rows:
+            self.total_records += 1
+            self.pub_cache.add(row["dedupkey"], row["bibtexkey"], row["author"], row["pubid"])
+        self.scrape_done = state.get("scrape_done", self.scrape_done)
+
+        return state
+
+    def parent_progress(self, parent, level, progress, parent_done):
+        '''
+        Record the progress on a parent in the frontier (marking it as done
+        if parent_done), and return the scrape progress to be stored in the
+        header
+        '''
+        if parent_done:
+            self.frontier.finish(parent)
+            progress = 0
+        else:
+            self.frontier.advance(parent.pubid, progress)
+
+        # the header keeps the position within the level, for display and
+        # for readers of the database
+        done, total = self.frontier.level_progress(parent.level)
+        return dict(current_row=done,
+                    current_level=level,
+                    progress=progress,
+                    level_limit=total,
+                    scrape_done=parent_done and not self.frontier.has_work())
+
+
+class EntryMemo(object):
+    '''
+    The BibTeX entries parsed most recently, by url, so a publication found
+    again (e.g. by another search of a batch) is not retrieved twice
+    '''
+    def __init__(self, size=100000):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+
+    def get(self, url):
+        entry = self.entries.pop(url, None)
+        if entry is None:
+            return None
+        self.entries[url] = entry
+        self.hits += 1
+        return dict(entry)
+
+    def put(self, url, entry):
+        self.entries[url] = dict(entry)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+
+class Session(object):
+    '''
+    Retrieval of the citations of publications over plain HTTP, without
+    Qt: each session has its own fetcher, and so its own cookies (kept in
+    the cookies file if given), and its request rate is adjusted by its own
+    RateController.
+    '''
+    def __init__(self, base_url=SCHOLAR_URL, max_in_flight=4, rate=1,
+                 cache=None, offline=False, cookies=None):
+        cookiejar = load_cookies(cookies) if cookies else None
+        self.fetcher = HTTPFetcher(base_url, cookiejar=cookiejar,
+                                   max_in_flight=max_in_flight, rate=rate,
+                                   cache=cache, offline=offline)
+        self.renewed = False
+        self.rate_control = RateController(rate, max_in_flight)
+        self.memo = None   # EntryMemo, if the entries are to be reused
+
+    def check(self, page):
+        kind = scraper.classify_page(page.url, page.html, page.text)
+        self.rate_control.observe(kind)
+        self.rate_control.apply(self.fetcher)
+        if kind is not None:
+            metrics.count('%s_pages' % kind)
+        if kind == 'suspect':
+            logger.warning('Warning: potential captcha/block found, but not confirmed')
+        elif kind is not None:
+            raise Blocked(kind, page)
+        return page
+
+    def fetch(self, url):
+        return self.check(self.fetcher.fetch(url))
+
+    def handshake(self):
+        '''
+        Get the session cookies, with the "Import into BibTeX" links enabled
+        '''
+        self.fetch("/ncr")
+        page = self.fetch(SETTINGS_URL)
+        url = scraper.settings_prefs_url(page.html)
+        if url is None:
+            logger.warning('Scholar settings form not found')
+        else:
+            self.fetch(url)
+        self.fetcher.save_session()
+
+    def start(self):
+        '''
+        Go through the handshake, unless the saved session is still valid
+        '''
+        if self.fetcher.session_valid():
+            logger.info('Reusing the saved Scholar session')
+        else:
+            self.handshake()
+
+    def results(self, url):
+        '''
+        Results listed on a page, including those without a BibTeX link
+        (which can not be imported)
+        '''
+        page = self.fetch(url)
+        metrics.count('result_pages')
+        if page.bibtex_lost and not self.renewed:
+            # the saved session lost the BibTeX preference
+            logger.warning('No BibTeX links found, renewing the Scholar session')
+            self.renewed = True
+            self.fetcher.reset_session()
+            self.fetcher.forget(url)
+            self.handshake()
+            return self.results(url)
+        self.renewed = False
+        return page.results
+
+    def entries(self, results):
+        '''
+        Publications of the results with a BibTeX link, with their BibTeX
+        entries
+        '''
+        results = [r for r in results if r.bibtex_url]
+        known = dict()
+        if self.memo is not None:
+            for r in results:
+                pub = self.memo.get(r.bibtex_url)
+                if pub is not None:
+                    known[r.bibtex_url] = pub
+        urls = [r.bibtex_url for r in results if r.bibtex_url not in known]
+        fetched = dict(zip(urls, self.fetcher.fetch_many(urls)))
+        if known:
+            metrics.count('bibtex_reused', len(known))
+        pubs = []
+        for r in results:
+            pub = known.get(r.bibtex_url)
+            if pub is None:
+                entry = fetched[r.bibtex_url]
+                if entry is None:
+                    if self.fetcher.offline:
+                        raise NotCached('%s: not in the cache' % r.bibtex_url)
+                    raise FetchError('Can not retrieve %s' % r.bibtex_url)
+                self.check(entry)
+                metrics.count('bibtex_entries')
+                with metrics.timer('bibtex'):
+                    pub = bibtex.parse(entry.text)
+                if self.memo is not None:
+                    self.memo.put(r.bibtex_url, pub)
+            pub["cites"] = r.cites
+            pub["citedby"] = r.citedby
+            pub["related"] = r.related
+            pubs.append(pub)
+        return pubs
+
+    def search(self, q, start=0):
+        '''
+        Publications found for a query, starting at start
+        '''
+        return self.entries(self.search_results(q, start))
+
+    def search_results(self, q, start=0):
+        '''
+        Results found for a query that can be imported (those with a BibTeX
+        link), starting at start, without retrieving their BibTeX entries
+        '''
+        return [r for r in self.results(SEARCH_URL % (urllib.quote_plus(q.encode('utf-8')), start))
+                if r.bibtex_url]
+
+    def citations(self, cites, offset, max_progress):
+        '''
+        Retrieve the next page of the publications citing cites, starting at
+        the result offset. Returns (publications, offset of the next page,
+        done). The offset counts every result listed, including those
+        without a BibTeX link, which are not imported.
+        '''
+        num = page_size(offset, max_progress)
+        results = self.results(cites_url(cites, offset, max_progress))[:num]
+        pubs = self.entries(results)
+        offset += len(results)
+        # citedby is only an estimate: a short page is the last one
+        done = offset >= max_progress or len(results) < num
+        return pubs, offset, done
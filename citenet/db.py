@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+'''
+citenet - Citation Network Analyzer
+Copyright (C) 2015 Jesse Lecy <jdlecy@gmail.com>, with contributions from
+Diego Moreda <diego.plan9@gmail.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along
+with this program; if not, write to the Free Software Foundation, Inc.,
+51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+'''
+
+import logging
+import re
+import sqlite3
+
+logger = logging.getLogger('main')
+
+PUB_COLUMNS = ['pubid', 'bibtexkey', 'type', 'title', 'author', 'journal',
+               'volume', 'num', 'pages', 'year', 'publisher', 'cites',
+               'citedby', 'related', 'searchlevel', 'dedupkey']
+
+RE_NON_WORD = re.compile(r'\W+', re.U)
+
+SQL_FIND_PUB = ('select PubID from Publications where DedupKey = ? '
+                'union all '
+                'select PubID from Publications where BibtexKey = ? and Author = ? '
+                'limit 1;')
+SQL_INSERT_PUB = 'insert into Publications(%s) values(%s);' % \
+    (",".join(PUB_COLUMNS), ",".join("?" * len(PUB_COLUMNS)))
+SQL_INSERT_CITATION = 'insert or ignore into CitationRelationship(Citation_ID, Publication_ID) values(?, ?);'
+SQL_SELECT_PUB = 'select Cites, BibtexKey, Title, Author, CitedBy from Publications where PubID = ?;'
+SQL_COUNT_PUBS = 'select count(rowid) from Publications;'
+SQL_SELECT_HEADER = 'select key, value from header;'
+SQL_INSERT_HEADER = 'insert into header(key, value) values(?, ?);'
+SQL_UPDATE_HEADER = 'update header set value = ? where key = ?;'
+
+SCHEMA = [
+    'drop table if exists header;',
+    'drop table if exists citationrelationship;',
+    'drop table if exists publications;',
+    'create table header(key varchar(64), value varchar(64));',
+    'create table CitationRelationship(Citation_ID text, Publication_ID text, primary key (Citation_ID, Publication_ID));',
+    'create table Publications (BibtexKey text, PubID text, Type text, Title text, Author text, Journal text, Volume integer, Num integer, Pages text, Year integer, Publisher text, Cites text, CitedBy integer, Related text, SearchLevel integer, DedupKey text, primary key (BibtexKey, Title));',
+]
+
+INDEXES = [
+    'create index if not exists Publications_DedupKey on Publications(DedupKey);',
+    'create index if not exists Publications_Author on Publications(BibtexKey, Author);',
+    'create index if not exists Publications_PubID on Publications(PubID);',
+    'create index if not exists CitationRelationship_Publication on CitationRelationship(Publication_ID);',
+]
+
+
+def dedup_key(bibtexkey, title):
+    '''
+    Normalized key used for detecting duplicate publications: the bibtex key
+    and the title, lowercase and without punctuation or spaces
+    '''
+    return u'%s:%s' % ((bibtexkey or u'').lower(),
+                       RE_NON_WORD.sub(u'', (title or u'').lower()))
+
+
+class DBConnection(object):
+    '''
+    Long-lived connection to a SQLite result file, and the statements used
+    on it. The database is put in WAL mode, so it can be read (e.g. from R)
+    while a search is writing to it, and the connection is kept open for the
+    whole search so the compiled statements are reused.
+
+    All the statements are parameterized; none of the methods commit, so
+    several of them can be grouped in a transaction.
+    '''
+    SYNCHRONOUS = 'NORMAL'   # durable at checkpoints, enough with WAL
+    CACHE_SIZE  = -16000     # page cache, in KiB when negative
+    BUSY_TIMEOUT = 30        # seconds to wait for a lock held by a reader
+    STATEMENTS  = 200        # number of compiled statements to keep
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.con = None
+
+    def open(self):
+        if self.con is not None:
+            return
+        self.con = sqlite3.connect(self.filename, timeout=self.BUSY_TIMEOUT,
+                                   cached_statements=self.STATEMENTS)
+        self.con.execute('pragma journal_mode = WAL;')
+        self.con.execute('pragma synchronous = %s;' % self.SYNCHRONOUS)
+        self.con.execute('pragma cache_size = %d;' % self.CACHE_SIZE)
+
+    def close(self):
+        if self.con:
+            self.con.close()
+        self.con = None
+
+    def commit(self):
+        if self.con:
+            self.con.commit()
+
+    def rollback(self):
+        if self.con:
+            self.con.rollback()
+
+    def get_cursor(self):
+        if self.con:
+            return self.con.cursor()
+        else:
+            logger.warning("Attempting to get cursor, but DB closed")
+            self.open()
+            return self.con.cursor()
+
+    # schema
+
+    def create_schema(self):
+        cur = self.get_cursor()
+        for q in SCHEMA + INDEXES:
+            cur.execute(q)
+
+    def upgrade_schema(self):
+        '''
+        Bring a result database created by a previous version up to date,
+        adding the dedup key column and the indexes
+        '''
+        cur = self.get_cursor()
+        cur.execute('pragma table_info(Publications);')
+        columns = [r[1].lower() for r in cur.fetchall()]
+        if 'dedupkey' not in columns:
+            logger.info('Upgrading db: adding dedup keys and indexes')
+            self.con.create_function('dedup_key', 2, dedup_key)
+            cur.execute('alter table Publications add column DedupKey text;')
+            cur.execute('update Publications set DedupKey = dedup_key(BibtexKey, Title);')
+        for q in INDEXES:
+            cur.execute(q)
+
+    # publications
+
+    def find_pub_id(self, bibtexkey, title, author):
+        '''
+        Id of a stored publication, matched on the dedup key or on
+        (bibtexkey, author); '' if not found
+        '''
+        r = self.get_cursor().execute(
+            SQL_FIND_PUB, (dedup_key(bibtexkey, title), bibtexkey, author)).fetchone()
+        if r is None:
+            return ''
+        return r[0]
+
+    def insert_publications(self, rows):
+        '''
+        Insert publications, given as dicts with PUB_COLUMNS keys
+        '''
+        self.get_cursor().executemany(
+            SQL_INSERT_PUB, [[row.get(k) for k in PUB_COLUMNS] for row in rows])
+
+    def insert_citations(self, edges):
+        '''
+        Insert (citing pubid, cited pubid) relationships, ignoring the ones
+        already stored
+        '''
+        self.get_cursor().executemany(SQL_INSERT_CITATION, edges)
+
+    def get_publication(self, pubid):
+        '''
+        (cites, bibtexkey, title, author, citedby) of a publication
+        '''
+        return self.get_cursor().execute(SQL_SELECT_PUB, (pubid,)).fetchone()
+
+    def count_publications(self):
+        return int(self.get_cursor().execute(SQL_COUNT_PUBS).fetchone()[0])
+
+    # header
+
+    def read_header(self):
+        return dict(self.get_cursor().execute(SQL_SELECT_HEADER).fetchall())
+
+    def insert_header(self, header):
+        self.get_cursor().executemany(SQL_INSERT_HEADER,
+                                      [(k, unicode(v)) for k, v in header.items()])
+
+    def update_header(self, header):
+        self.get_cursor().executemany(SQL_UPDATE_HEADER,
+                                      [(unicode(v), k) for k, v in header.items()])
+
+    def set_header(self, header):
+        '''
+        Update the given header keys, adding the ones not stored yet (e.g.
+        in databases from previous versions)
+        '''
+        cur = self.get_cursor()
+        for k, v in header.items():
+            cur.execute(SQL_UPDATE_HEADER, (unicode(v), k))
+            if cur.rowcount == 0:
+                cur.execute(SQL_INSERT_HEADER, (k, unicode(v)))
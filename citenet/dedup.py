@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+'''
+citenet - Citation Network Analyzer
+Copyright (C) 2015 Jesse Lecy <jdlecy@gmail.com>, with contributions from
+Diego Moreda <diego.plan9@gmail.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along
+with this program; if not, write to the Free Software Foundation, Inc.,
+51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+'''
+
+import anydbm
+from collections import OrderedDict
+import logging
+
+logger = logging.getLogger('main')
+
+
+def author_key(bibtexkey, author):
+    return u'\x00%s\x00%s' % (bibtexkey or u'', author or u'')
+
+
+class DedupCache(object):
+    '''
+    Bounded LRU map from publication keys (the dedup key, and the bibtex key
+    plus author) to publication ids, so that most duplicate checks never
+    reach the database.
+
+    When the cache holds every publication of the database (it was loaded
+    from it and nothing was evicted, or the evicted entries were spilled to
+    disk), a miss means the publication is new, and find returns ''.
+    Otherwise find returns None and the database has to be checked.
+    '''
+    def __init__(self, capacity=100000, spill_path=None):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.complete = True
+        self.hits = 0
+        self.misses = 0
+        self.spill = None
+        if spill_path is not None:
+            self.spill = anydbm.open(spill_path, 'n')
+
+    def close(self):
+        if self.spill is not None:
+            self.spill.close()
+            self.spill = None
+
+    def load(self, cur):
+        '''
+        Fill the cache from the Publications table
+        '''
+        cur.execute('select DedupKey, BibtexKey, Author, PubID from Publications;')
+        for r in cur:
+            self.add(r[0], r[1], r[2], r[3])
+        logger.info('Dedup cache loaded with %i entries' % len(self.entries))
+
+    def _get(self, key):
+        pubid = self.entries.pop(key, None)
+        if pubid is None and self.spill is not None:
+            k = key.encode('utf-8')
+            if self.spill.has_key(k):
+                pubid = self.spill[k].decode('utf-8')
+        if pubid is not None:
+            self._put(key, pubid)
+        return pubid
+
+    def _has(self, key):
+        if key in self.entries:
+            return True
+        return self.spill is not None and self.spill.has_key(key.encode('utf-8'))
+
+    def _put(self, key, pubid):
+        self.entries.pop(key, None)
+        self.entries[key] = pubid
+        while len(self.entries) > self.capacity:
+            k, v = self.entries.popitem(last=False)
+            if self.spill is not None:
+                self.spill[k.encode('utf-8')] = v.encode('utf-8')
+            else:
+                self.complete = False
+
+    def find(self, dedup, bibtexkey, author):
+        '''
+        Publication id, '' if the publication is surely not stored, or None
+        if unknown
+        '''
+        pubid = self._get(dedup)
+        if pubid is None:
+            pubid = self._get(author_key(bibtexkey, author))
+
+        if pubid is not None:
+            self.hits += 1
+            return pubid
+        self.misses += 1
+        return '' if self.complete else None
+
+    def add(self, dedup, bibtexkey, author, pubid):
+        if dedup:
+            self._put(dedup, pubid)
+        if author:
+            # the first publication stored for (bibtexkey, author) wins, as
+            # in the database lookup
+            k = author_key(bibtexkey, author)
+            if not self._has(k):
+                self._put(k, pubid)
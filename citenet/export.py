@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+'''
+citenet - Citation Network Analyzer
+Copyright (C) 2015 Jesse Lecy <jdlecy@gmail.com>, with contributions from
+Diego Moreda <diego.plan9@gmail.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along
+with this program; if not, write to the Free Software Foundation, Inc.,
+51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+Export of a result database to other formats. Usage:
+
+    python -m citenet export DB OUTPUT [-format F] [-table T] [-chunk N]
+
+The format is taken from the extension of OUTPUT unless given:
+
+    csv        a table, as comma separated values
+    parquet    a table, as Parquet (requires pyarrow)
+    arrow      a table, as an Arrow IPC file (requires pyarrow)
+    edges      the citation graph, one "citing<TAB>cited" line per edge
+    graphml    the citation graph, with the publications as nodes
+
+The table is publications (default) or citations. The rows are read and
+written in chunks of N (10000 by default), so the memory used does not
+depend on the size of the database.
+'''
+
+import csv
+import logging
+import os
+import re
+import sys
+from xml.sax.saxutils import escape, quoteattr
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from cmdline import get_arg
+from db import DBConnection
+
+logger = logging.getLogger('main')
+
+CHUNK = 10000
+
+TABLES = {
+    'publications': 'select * from Publications;',
+    'citations': 'select Citation_ID, Publication_ID from CitationRelationship;',
+}
+
+# the other columns are exported as text (volumes, numbers and pages taken
+# from BibTeX are not always numbers)
+INTEGER_COLUMNS = ('year', 'citedby', 'searchlevel')
+
+EXTENSIONS = {
+    '.csv': 'csv',
+    '.parquet': 'parquet',
+    '.arrow': 'arrow',
+    '.feather': 'arrow',
+    '.edges': 'edges',
+    '.tsv': 'edges',
+    '.graphml': 'graphml',
+}
+
+# characters not allowed in XML 1.0
+RE_XML_INVALID = re.compile(u'[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+
+class ExportError(Exception):
+    pass
+
+
+def chunks(dbcon, query, chunk=CHUNK):
+    '''
+    Rows of a query, in lists of at most chunk rows
+    '''
+    cur = dbcon.get_cursor()
+    cur.execute(query)
+    while True:
+        batch = cur.fetchmany(chunk)
+        if not batch:
+            return
+        yield batch
+
+
+def rows(dbcon, query, chunk=CHUNK):
+    for batch in chunks(dbcon, query, chunk):
+        for row in batch:
+            yield row
+
+
+def column_names(dbcon, query):
+    cur = dbcon.get_cursor()
+    cur.execute(query)
+    names = [d[0] for d in cur.description]
+    cur.close()
+    return names
+
+
+def to_int(v):
+    try:
+        return int(v)
+    except (TypeError, ValueError):
+        return None
+
+
+def encode(v):
+    if v is None:
+        return ''
+    if isinstance(v, unicode):
+        return v.encode('utf-8')
+    return str(v)
+
+
+def export_csv(dbcon, query, out, chunk=CHUNK):
+    n = 0
+    with open(out, 'wb') as f:
+        writer = csv.writer(f)
+        writer.writerow(column_names(dbcon, query))
+        for batch in chunks(dbcon, query, chunk):
+            writer.writerows([encode(v) for v in row] for row in batch)
+            n += len(batch)
+    return n
+
+
+def arrow_schema(names):
+    return pyarrow.schema([
+        pyarrow.field(name, pyarrow.int64() if name.lower() in INTEGER_COLUMNS else pyarrow.string())
+        for name in names])
+
+
+def arrow_batch(schema, batch):
+    columns = []
+    for i, field in enumerate(schema):
+        if field.type == pyarrow.int64():
+            values = [to_int(row[i]) for row in batch]
+        else:
+            values = [None if row[i] is None else unicode(row[i]) for row in batch]
+        columns.append(pyarrow.array(values, type=field.type))
+    return pyarrow.RecordBatch.from_arrays(columns, schema.names)
+
+
+def export_arrow(dbcon, query, out, fmt, chunk=CHUNK):
+    if pyarrow is None:
+        raise ExportError('The %s format requires pyarrow (pip install pyarrow)' % fmt)
+    schema = arrow_schema(column_names(dbcon, query))
+    if fmt == 'parquet':
+        writer = pyarrow.parquet.ParquetWriter(out, schema)
+        write = lambda b: writer.write_table(pyarrow.Table.from_batches([b]))
+    else:
+        writer = pyarrow.RecordBatchFileWriter(out, schema)
+        write = writer.write_batch
+    n = 0
+    try:
+        # each chunk is a row group (Parquet) or record batch (Arrow)
+        for batch in chunks(dbcon, query, chunk):
+            write(arrow_batch(schema, batch))
+            n += len(batch)
+    finally:
+        writer.close()
+    return n
+
+
+def export_edges(dbcon, out, chunk=CHUNK):
+    n = 0
+    with open(out, 'wb') as f:
+        for citing, cited in rows(dbcon, TABLES['citations'], chunk):
+            f.write('%s\t%s\n' % (encode(citing), encode(cited)))
+            n += 1
+    return n
+
+
+def xml_text(v):
+    if not isinstance(v, unicode):
+        v = unicode(v)
+    return RE_XML_INVALID.sub(u'', v).encode('utf-8')
+
+
+def export_graphml(dbcon, out, chunk=CHUNK):
+    '''
+    Directed graph from the citing to the cited publication, with the
+    columns of Publications as node attributes
+    '''
+    query = TABLES['publications']
+    names = column_names(dbcon, query)
+    pubid = [name.lower() for name in names].index('pubid')
+    keys = [(i, name) for i, name in enumerate(names) if i != pubid]
+    n = 0
+    with open(out, 'wb') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n')
+        for i, name in keys:
+            f.write('<key id="d%d" for="node" attr.name=%s attr.type="%s"/>\n' %
+                    (i, quoteattr(name), 'long' if name.lower() in INTEGER_COLUMNS else 'string'))
+        f.write('<graph id="citations" edgedefault="directed">\n')
+
+        for row in rows(dbcon, query, chunk):
+            f.write('<node id=%s>' % quoteattr(xml_text(row[pubid])))
+            for i, name in keys:
+                v = row[i]
+                if name.lower() in INTEGER_COLUMNS:
+                    v = to_int(v)
+                if v is not None:
+                    f.write('<data key="d%d">%s</data>' % (i, escape(xml_text(v))))
+            f.write('</node>\n')
+
+        for citing, cited in rows(dbcon, TABLES['citations'], chunk):
+            f.write('<edge source=%s target=%s/>\n' %
+                    (quoteattr(xml_text(citing)), quoteattr(xml_text(cited))))
+            n += 1
+        f.write('</graph>\n</graphml>\n')
+    return n
+
+
+def export(path, out, fmt=None, table='publications', chunk=CHUNK):
+    '''
+    Export a table (csv, parquet, arrow) or the citation graph (edges,
+    graphml) of the result database in path to out. Returns the number of
+    rows (or edges) written.
+    '''
+    if fmt is None:
+        fmt = EXTENSIONS.get(os.path.splitext(out)[1].lower())
+        if fmt is None:
+            raise ExportError('Unknown format for %s, use -format' % out)
+    if table not in TABLES:
+        raise ExportError('Unknown table %s (%s)' % (table, ', '.join(sorted(TABLES))))
+    if not os.path.exists(path):
+        raise ExportError('%s does not exist' % path)
+
+    dbcon = DBConnection(path)
+    dbcon.open()
+    try:
+        if fmt == 'csv':
+            return export_csv(dbcon, TABLES[table], out, chunk)
+        elif fmt in ('parquet', 'arrow'):
+            return export_arrow(dbcon, TABLES[table], out, fmt, chunk)
+        elif fmt == 'edges':
+            return export_edges(dbcon, out, chunk)
+        elif fmt == 'graphml':
+            return export_graphml(dbcon, out, chunk)
+        raise ExportError('Unknown format %s' % fmt)
+    finally:
+        dbcon.close()
+
+
+def main():
+    if len(sys.argv) < 3 or sys.argv[1].startswith('-') or sys.argv[2].startswith('-'):
+        print __doc__[__doc__.index('Usage:'):]
+        return 2
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    try:
+        n = export(sys.argv[1], sys.argv[2], get_arg('-format'),
+                   get_arg('-table', 'publications'), int(get_arg('-chunk', CHUNK)))
+    except ExportError, e:
+        logger.error(e)
+        return 1
+    logger.info('%d rows written to %s' % (n, sys.argv[2]))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*-
+'''
+citenet - Citation Network Analyzer
+Copyright (C) 2015 Jesse Lecy <jdlecy@gmail.com>, with contributions from
+Diego Moreda <diego.plan9@gmail.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along
+with this program; if not, write to the Free Software Foundation, Inc.,
+51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+'''
+
+import cookielib
+import httplib
+import logging
+import os
+import Queue
+import socket
+import threading
+import time
+import urllib
+import urllib2
+from urlparse import urljoin, urlparse
+
+import metrics
+import scraper
+
+logger = logging.getLogger('main')
+
+SCHOLAR_URL = 'http://scholar.google.com/'
+USER_AGENT = 'Mozilla/5.0 (Windows NT 6.1; rv:38.0) Gecko/20100101 Firefox/38.0'
+COOKIES_PATH = os.path.join(os.path.expanduser('~'), '.citenet_cookies.txt')
+
+
+class FetchError(Exception):
+    '''
+    Network level error (connection refused, timeout, etc) while fetching
+    '''
+    pass
+
+
+class NotCached(FetchError):
+    '''
+    Page not in the cache while offline: retrying will not help
+    '''
+    pass
+
+
+def load_cookies(path):
+    '''
+    Cookie jar kept in a file, with the cookies saved there if any
+    '''
+    jar = cookielib.LWPCookieJar(path)
+    if os.path.exists(path):
+        try:
+            jar.load(ignore_discard=True)
+        except (IOError, cookielib.LoadError) as e:
+            logger.warning('Can not load the cookies from %s: %s' % (path, e))
+    return jar
+
+
+class Page(object):
+    '''
+    A fetched document: the final url (after redirects), the HTTP status and
+    the raw body. The plain text and the results are only extracted when
+    needed (see prepare).
+    '''
+    def __init__(self, url, html, status=200, content_type='text/html',
+                 text=None):
+        self.url = url
+        self.html = html
+        self.status = status
+        self.content_type = content_type
+        self._text = text
+        self._results = None
+
+    @property
+    def text(self):
+        if self._text is None:
+            if 'html' in self.content_type:
+                with metrics.timer('html_to_text'):
+                    self._text = scraper.html_to_text(self.html)
+            else:
+                self._text = self.html
+        return self._text
+
+    @property
+    def results(self):
+        if self._results is None:
+            if 'html' in self.content_type:
+                with metrics.timer('parse_results'):
+                    self._results = scraper.parse_results(self.html)
+            else:
+                self._results = []
+        return self._results
+
+    @property
+    def bibtex_lost(self):
+        '''
+        Whether the results show that the session lost the BibTeX
+        preference: several results listed, none with a BibTeX link (a
+        single one without it can just be a citation that can not be
+        exported)
+        '''
+        results = self.results
+        return len(results) > 1 and not any(r.bibtex_url for r in results)
+
+    def prepare(self):
+        '''
+        Extract the text and results now, e.g. on the fetching thread so the
+        UI thread does not have to
+        '''
+        self.text
+        self.results
+        return self
+
+
+class RateLimiter(object):
+    '''
+    Spaces the requests to each host at least 1/rate seconds apart. Safe to
+    share between threads; a rate of 0 disables the limit.
+    '''
+    def __init__(self, rate=0):
+        self.rate = rate
+        self.lock = threading.Lock()
+        self.next_slot = dict()
+
+    def wait(self, host):
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.time()
+            slot = max(now, self.next_slot.get(host, 0))
+            self.next_slot[host] = slot + 1.0 / self.rate
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class HTTPFetcher(object):
+    '''
+    Pure HTTP fetcher: retrieves the raw documents without rendering them,
+    keeping the session cookies in its own cookie jar. Relative urls are
+    resolved against base_url.
+
+    The politeness budget is given by max_in_flight (concurrent requests in
+    fetch_many) and rate (requests per second to the same host).
+
+    If a ResponseCache is given, pages are looked up there before touching
+    the network, and the valid ones are stored. When offline, only the
+    cache is used.
+    '''
+    def __init__(self, base_url=SCHOLAR_URL, timeout=30, cookiejar=None,
+                 max_in_flight=4, rate=1, cache=None, offline=False):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.cache = cache
+        self.offline = offline
+        self.max_in_flight = max_in_flight
+        self.limiter = RateLimiter(rate)
+        self.requests = 0      # made over the network, for budgets
+        self.lock = threading.Lock()
+        if cookiejar is None:
+            cookiejar = cookielib.CookieJar()
+        self.cookiejar = cookiejar
+        self.opener = urllib2.build_opener(
+            urllib2.HTTPCookieProcessor(self.cookiejar))
+        self.opener.addheaders = [('User-Agent', USER_AGENT),
+                                  ('Accept-Language', 'en-US,en;q=0.5')]
+
+    def session_valid(self):
+        '''
+        Whether the cookies hold a Scholar session with the BibTeX export
+        enabled (a GSP cookie with CF=4) that has not expired
+        '''
+        host = urlparse(self.base_url).hostname or ''
+        for c in self.cookiejar:
+            if c.name == 'GSP' and 'CF=4' in (c.value or '') and not c.is_expired() and \
+                    host.endswith(c.domain.lstrip('.')):
+                return True
+        return False
+
+    def save_session(self):
+        '''
+        Save the cookies, if they are kept in a file
+        '''
+        if isinstance(self.cookiejar, cookielib.FileCookieJar) and self.cookiejar.filename:
+            try:
+                self.cookiejar.save(ignore_discard=True)
+            except IOError as e:
+                logger.warning('Can not save the cookies: %s' % e)
+
+    def reset_session(self):
+        self.cookiejar.clear()
+
+    def absolute(self, url):
+        '''
+        Resolve url against base_url, quoting any unsafe characters (the
+        query string is typed in by the user)
+        '''
+        if isinstance(url, unicode):
+            url = url.encode('utf-8')
+        return urllib.quote(urljoin(self.base_url, url),
+                            safe="%/:=&?~#+!$,;'@()*[]")
+
+    def cached(self, url):
+        '''
+        Whether url would be answered from the cache
+        '''
+        if self.cache is None:
+            return False
+        url = self.absolute(url)
+        return self.cache.cacheable(url) and self.cache.contains(url)
+
+    def forget(self, url):
+        '''
+        Drop url from the cache, so it is fetched again
+        '''
+        if self.cache is not None:
+            self.cache.delete(self.absolute(url))
+
+    def fetch(self, url):
+        '''
+        Fetch an url, returning a Page. HTTP errors (403, 503, ...) are
+        returned as pages as well, as their content is needed for detecting
+        captchas and blocks; FetchError is raised on network errors.
+        '''
+        url = self.absolute(url)
+        cacheable = self.cache is not None and self.cache.cacheable(url)
+        if cacheable:
+            r = self.cache.get(url)
+            if r is not None:
+                metrics.count('cache_hits')
+                return Page(*r)
+        if self.offline:
+            if not cacheable:
+                # requests made for their cookies, nothing to replay
+                return Page(url, u'')
+            raise NotCached('%s: not in the cache' % url)
+
+        with metrics.timer('rate_wait'):
+            self.limiter.wait(urlparse(url).netloc)
+        with self.lock:
+            self.requests += 1
+        metrics.count('requests')
+        try:
+            with metrics.timer('network'):
+                try:
+                    res = self.opener.open(url, timeout=self.timeout)
+                except urllib2.HTTPError as e:
+                    res = e
+                body = res.read()
+            status = res.getcode()
+            final_url = res.geturl()
+            info = res.info()
+        except (urllib2.URLError, httplib.HTTPException, socket.error) as e:
+            metrics.count('fetch_errors')
+            raise FetchError('%s: %s' % (url, e))
+        metrics.count('bytes', len(body))
+
+        content_type = info.gettype() if info is not None else 'text/html'
+        charset = (info.getparam('charset') if info is not None else None) or 'utf-8'
+        try:
+            html = body.decode(charset, 'replace')
+        except LookupError:
+            html = body.decode('utf-8', 'replace')
+
+        page = Page(final_url, html, status, content_type)
+        # captcha and block pages are never stored, nor results fetched
+        # without the BibTeX preference (they have no import links)
+        if cacheable and status == 200 and \
+                scraper.classify_page(final_url, html, page.text) is None and \
+                not page.bibtex_lost:
+            self.cache.put(url, final_url, html, status, content_type)
+        return page
+
+    def fetch_async(self, url, callback):
+        '''
+        Fetch an url on a background thread, calling callback(page) when
+        done. page is None if a network error occurred.
+        '''
+        def run():
+            try:
+                page = self.fetch(url).prepare()
+            except FetchError as e:
+                logger.warning('Error fetching %s' % e)
+                page = None
+            callback(page)
+
+        t = threading.Thread(target=run)
+        t.daemon = True
+        t.start()
+        return t
+
+    def fetch_many(self, urls):
+        '''
+        Fetch a list of urls with at most max_in_flight concurrent requests.
+        The pages are returned in the same order as urls, with None for the
+        urls that could not be fetched.
+        '''
+        pages = [None] * len(urls)
+        queue = Queue.Queue()
+        for i, url in enumerate(urls):
+            queue.put((i, url))
+
+        def worker():
+            while True:
+                try:
+                    i, url = queue.get_nowait()
+                except Queue.Empty:
+                    return
+                try:
+                    pages[i] = self.fetch(url).prepare()
+                except FetchError as e:
+                    logger.warning('Error fetching %s' % e)
+
+        threads = [threading.Thread(target=worker)
+                   for _ in xrange(min(self.max_in_flight, len(urls)))]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        for t in threads:
+            t.join()
+        return pages
+
+    def fetch_many_async(self, urls, callback):
+        '''
+        fetch_many on a background thread, calling callback(pages) when done
+        '''
+        t = threading.Thread(target=lambda: callback(self.fetch_many(urls)))
+        t.daemon = True
+        t.start()
+        return t
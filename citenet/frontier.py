@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+'''
+citenet - Citation Network Analyzer
+Copyright (C) 2015 Jesse Lecy <jdlecy@gmail.com>, with contributions from
+Diego Moreda <diego.plan9@gmail.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along
+with this program; if not, write to the Free Software Foundation, Inc.,
+51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+'''
+
+from collections import namedtuple
+import logging
+
+logger = logging.getLogger('main')
+
+# states of a frontier entry
+PENDING = 0
+ACTIVE  = 1
+DONE    = 2
+
+FrontierItem = namedtuple('FrontierItem', ['pubid', 'level', 'offset'])
+
+
+def _citedby(citedby):
+    try:
+        return int(citedby or 0)
+    except ValueError:
+        return 0
+
+
+def order_priority(level, citedby):
+    # breadth first, in the order the publications were found
+    return level
+
+
+def citedby_priority(level, citedby):
+    # most cited first, at any level
+    return -_citedby(citedby)
+
+
+def level_priority(level, citedby):
+    # closest to the seeds first, most cited first within a level
+    return level + 1.0 / (1 + _citedby(citedby))
+
+
+# prioritization policies, by name: functions of the level and the cited by
+# count of a publication, lower values are expanded first
+POLICIES = {
+    'order':   order_priority,
+    'citedby': citedby_priority,
+    'level':   level_priority,
+}
+DEFAULT_POLICY = 'order'
+
+SCHEMA = [
+    'drop table if exists Frontier;',
+    'create table Frontier(Seq integer primary key, PubID text unique, Level integer, Priority real, State integer, PageOffset integer);',
+    'create index Frontier_Next on Frontier(State, Priority, Seq);',
+]
+
+SQL_PUSH    = 'insert or ignore into Frontier(PubID, Level, Priority, State, PageOffset) values(?, ?, ?, %d, 0);' % PENDING
+SQL_NEXT    = 'select PubID, Level, PageOffset from Frontier where State = ? order by Priority, Seq limit ?;'
+SQL_STATE   = 'update Frontier set State = ? where PubID = ?;'
+SQL_ADVANCE = 'update Frontier set PageOffset = ? where PubID = ?;'
+SQL_WORK    = 'select 1 from Frontier where State < %d limit 1;' % DONE
+SQL_COUNTS  = 'select Level, State, count(*) from Frontier group by Level, State;'
+SQL_REPRIORITIZE = '''update Frontier set Priority = priority(Level,
+    (select CitedBy from Publications where Publications.PubID = Frontier.PubID))
+    where State = %d;''' % PENDING
+
+# frontier of a database created before the table existed: the publications
+# up to current_row (in rowid order) are done, the next one is in progress
+SQL_BUILD = '''insert into Frontier(Seq, PubID, Level, Priority, State, PageOffset)
+    select rowid, PubID, SearchLevel, priority(SearchLevel, CitedBy),
+           case when rowid <= :current_row then %d
+                when rowid = :current_row + 1 then %d
+                else %d end,
+           case when rowid = :current_row + 1 then :progress else 0 end
+    from Publications where SearchLevel < :max_level - 1 order by rowid;''' % (DONE, ACTIVE, PENDING)
+
+
+class Frontier(object):
+    '''
+    Persistent queue of the publications whose citations are still to be
+    collected, kept in the Frontier table of the result database.
+
+    Each entry has the level of the publication, a priority given by the
+    policy (lower goes first, see POLICIES), a state (pending, active or
+    done) and the offset of the next page of citations to retrieve. Work is
+    handed out with next(); several entries can be active at once, and
+    entries left active by a previous session are resumed first from their
+    page offset.
+
+    Like DBConnection, none of the methods commit.
+    '''
+    def __init__(self, dbcon, max_level, policy=DEFAULT_POLICY):
+        self.dbcon = dbcon
+        self.max_level = max_level
+        self.policy = policy
+        self.priority = POLICIES[policy]
+        self.leased = set()     # active entries handed out in this session
+        self.totals = dict()    # level -> number of entries
+        self.done = dict()      # level -> number of entries done
+
+    def create(self):
+        cur = self.dbcon.get_cursor()
+        for q in SCHEMA:
+            cur.execute(q)
+
+    def exists(self):
+        return self.dbcon.get_cursor().execute(
+            "select 1 from sqlite_master where type = 'table' and name = 'Frontier';").fetchone() is not None
+
+    def build(self, current_row, progress):
+        '''
+        Create the frontier of a database that was being traversed in rowid
+        order, from the position stored in its header
+        '''
+        logger.info('Building the crawl frontier')
+        self.create()
+        self.dbcon.con.create_function('priority', 2, self.priority)
+        self.dbcon.get_cursor().execute(SQL_BUILD, dict(current_row=current_row,
+                                                        progress=progress,
+                                                        max_level=self.max_level))
+
+    def load(self):
+        '''
+        Count the entries of each level, for reporting progress
+        '''
+        self.totals = dict()
+        self.done = dict()
+        for level, state, n in self.dbcon.get_cursor().execute(SQL_COUNTS):
+            self.totals[level] = self.totals.get(level, 0) + n
+            if state == DONE:
+                self.done[level] = self.done.get(level, 0) + n
+
+    def expands(self, level):
+        '''
+        Whether the citations of a publication of this level are collected
+        '''
+        return level < self.max_level - 1
+
+    def reprioritize(self):
+        '''
+        Recompute the priority of the pending entries, after a change of
+        policy
+        '''
+        logger.info('Prioritizing the crawl frontier by "%s"' % self.policy)
+        self.dbcon.con.create_function('priority', 2, self.priority)
+        self.dbcon.get_cursor().execute(SQL_REPRIORITIZE)
+
+    def push(self, entries):
+        '''
+        Add (pubid, level, citedby) entries, skipping the levels that are not
+        expanded
+        '''
+        entries = [e for e in entries if self.expands(e[1])]
+        self.dbcon.get_cursor().executemany(
+            SQL_PUSH, [(pubid, level, self.priority(level, citedby)) for pubid, level, citedby in entries])
+        for pubid, level, citedby in entries:
+            self.totals[level] = self.totals.get(level, 0) + 1
+
+    def next(self):
+        '''
+        Next entry to work on (marking it as active), or None if there is no
+        work left
+        '''
+        cur = self.dbcon.get_cursor()
+        # entries left active by a previous session go first
+        for state in (ACTIVE, PENDING):
+            for pubid, level, offset in cur.execute(SQL_NEXT, (state, len(self.leased) + 1)).fetchall():
+                if pubid in self.leased:
+                    continue
+                if state == PENDING:
+                    cur.execute(SQL_STATE, (ACTIVE, pubid))
+                self.leased.add(pubid)
+                return FrontierItem(pubid, level, offset)
+        return None
+
+    def advance(self, pubid, offset):
+        self.dbcon.get_cursor().execute(SQL_ADVANCE, (offset, pubid))
+
+    def finish(self, item):
+        self.dbcon.get_cursor().execute(SQL_STATE, (DONE, item.pubid))
+        self.leased.discard(item.pubid)
+        self.done[item.level] = self.done.get(item.level, 0) + 1
+
+    def release(self, item):
+        '''
+        Give back an active entry without finishing it
+        '''
+        self.leased.discard(item.pubid)
+
+    def has_work(self):
+        return self.dbcon.get_cursor().execute(SQL_WORK).fetchone() is not None
+
+    def level_progress(self, level):
+        '''
+        (entries done, entries) of a level
+        '''
+        return self.done.get(level, 0), self.totals.get(level, 0)
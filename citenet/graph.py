@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+'''
+citenet - Citation Network Analyzer
+Copyright (C) 2015 Jesse Lecy <jdlecy@gmail.com>, with contributions from
+Diego Moreda <diego.plan9@gmail.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along
+with this program; if not, write to the Free Software Foundation, Inc.,
+51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+Citation graph metrics of a result database. Usage:
+
+    python -m citenet graph DB [-top N] [-refresh]
+
+Computes the in and out degree, co-citation and bibliographic coupling
+counts and PageRank of every publication, and the publications and
+citations per search level, storing them in the GraphMetrics and
+GraphLevels tables of the database. They are only computed again when
+the database has changed (or with -refresh). Requires numpy.
+'''
+
+from itertools import izip
+import logging
+import os
+import sys
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from cmdline import get_arg
+from db import DBConnection
+
+logger = logging.getLogger('main')
+
+CHUNK = 100000
+
+SQL_SELECT_PUBS = 'select PubID, SearchLevel from Publications;'
+SQL_SELECT_EDGES = 'select Citation_ID, Publication_ID from CitationRelationship;'
+SQL_COUNT_EDGES = 'select count(*) from CitationRelationship;'
+SQL_INSERT_METRICS = 'insert or replace into GraphMetrics values(?, ?, ?, ?, ?, ?);'
+SQL_INSERT_LEVEL = 'insert into GraphLevels values(?, ?, ?);'
+SQL_TOP = ('select m.PubID, p.Title, p.Year, m.InDegree, m.PageRank from GraphMetrics m '
+           'left join Publications p on p.PubID = m.PubID order by m.%s desc limit ?;')
+
+SCHEMA = [
+    'drop table if exists GraphMetrics;',
+    'drop table if exists GraphLevels;',
+    'create table GraphMetrics(PubID text primary key, InDegree integer, OutDegree integer, CoCitation integer, Coupling integer, PageRank real);',
+    'create table GraphLevels(Level integer primary key, Publications integer, Citations integer);',
+]
+
+
+class GraphError(Exception):
+    pass
+
+
+def csr(src, dst, n):
+    '''
+    (indptr, indices) of the edges src -> dst over n nodes, sorted by src
+    '''
+    order = numpy.argsort(src, kind='mergesort')
+    indptr = numpy.zeros(n + 1, dtype=numpy.int64)
+    numpy.cumsum(numpy.bincount(src, minlength=n), out=indptr[1:])
+    return indptr, dst[order]
+
+
+class CitationGraph(object):
+    '''
+    Citation graph with the pubids interned to the integers 0..n-1 and the
+    edges (citing -> cited) in compressed sparse row form: the publications
+    cited by node i are cited[indptr[i]:indptr[i+1]], and the ones citing
+    it citing[rindptr[i]:rindptr[i+1]].
+    '''
+    def __init__(self, pubids, levels, src, dst):
+        self.pubids = pubids
+        self.levels = levels
+        self.n = n = len(pubids)
+        self.edges = len(src)
+        self.out_degree = numpy.bincount(src, minlength=n)
+        self.in_degree = numpy.bincount(dst, minlength=n)
+        self.indptr, self.cited = csr(src, dst, n)
+        self.rindptr, self.citing = csr(dst, src, n)
+        # source of each edge, in the order of cited
+        self.src = numpy.repeat(numpy.arange(n), self.out_degree)
+
+    @classmethod
+    def load(cls, dbcon, chunk=CHUNK):
+        '''
+        Read the graph of a result database. Publications only found in
+        CitationRelationship get level -1.
+        '''
+        cur = dbcon.get_cursor()
+        index = dict()
+        pubids = []
+        levels = []
+        for pubid, level in cur.execute(SQL_SELECT_PUBS):
+            if pubid not in index:
+                index[pubid] = len(pubids)
+                pubids.append(pubid)
+                levels.append(level if level is not None else -1)
+
+        def intern(pubid):
+            i = index.get(pubid)
+            if i is None:
+                i = index[pubid] = len(pubids)
+                pubids.append(pubid)
+                levels.append(-1)
+            return i
+
+        src, dst = [], []
+        cur.execute(SQL_SELECT_EDGES)
+        while True:
+            batch = cur.fetchmany(chunk)
+            if not batch:
+                break
+            src.append(numpy.fromiter((intern(a) for a, b in batch), numpy.int64, len(batch)))
+            dst.append(numpy.fromiter((intern(b) for a, b in batch), numpy.int64, len(batch)))
+        empty = numpy.zeros(0, dtype=numpy.int64)
+        return cls(pubids, numpy.array(levels, dtype=numpy.int64),
+                   numpy.concatenate(src) if src else empty,
+                   numpy.concatenate(dst) if dst else empty)
+
+    def level_counts(self):
+        '''
+        [(level, publications, citations made by its publications)]
+        '''
+        known = self.levels >= 0
+        if not known.any():
+            return []
+        m = self.levels.max() + 1
+        pubs = numpy.bincount(self.levels[known], minlength=m)
+        src_levels = self.levels[self.src]
+        cites = numpy.bincount(src_levels[src_levels >= 0], minlength=m)
+        return zip(xrange(m), pubs.tolist(), cites.tolist())
+
+    def cocitation(self):
+        '''
+        Co-citation count of each publication: times it is cited together
+        with another one, summed over all the others
+        '''
+        return numpy.bincount(self.cited, weights=(self.out_degree - 1)[self.src],
+                              minlength=self.n).astype(numpy.int64)
+
+    def coupling(self):
+        '''
+        Bibliographic coupling count of each publication: references shared
+        with another one, summed over all the others
+        '''
+        return numpy.bincount(self.src, weights=(self.in_degree - 1)[self.cited],
+                              minlength=self.n).astype(numpy.int64)
+
+    def pagerank(self, damping=0.85, tol=1e-10, max_iter=100):
+        '''
+        PageRank by power iteration, the rank flowing from the citing to
+        the cited publications. The rank of publications citing none is
+        spread evenly over all of them.
+        '''
+        n = self.n
+        if n == 0:
+            return numpy.zeros(0)
+        out = self.out_degree
+        dangling = out == 0
+        inv_out = numpy.zeros(n)
+        inv_out[~dangling] = 1.0 / out[~dangling]
+        pr = numpy.full(n, 1.0 / n)
+        for _ in xrange(max_iter):
+            flow = numpy.bincount(self.cited, weights=(pr * inv_out)[self.src], minlength=n)
+            new = damping * (flow + pr[dangling].sum() / n) + (1 - damping) / n
+            err = numpy.abs(new - pr).sum()
+            pr = new
+            if err < n * tol:
+                break
+        return pr
+
+    def save(self, dbcon):
+        '''
+        Store the metrics in the GraphMetrics and GraphLevels tables,
+        replacing the previous ones
+        '''
+        cur = dbcon.get_cursor()
+        for q in SCHEMA:
+            cur.execute(q)
+        cur.executemany(SQL_INSERT_METRICS, izip(
+            self.pubids, self.in_degree.tolist(), self.out_degree.tolist(),
+            self.cocitation().tolist(), self.coupling().tolist(),
+            self.pagerank().tolist()))
+        cur.executemany(SQL_INSERT_LEVEL, self.level_counts())
+        dbcon.set_header(dict(graph_publications=dbcon.count_publications(),
+                              graph_citations=self.edges))
+
+
+def up_to_date(dbcon):
+    '''
+    Whether the stored metrics correspond to the current database
+    '''
+    header = dbcon.read_header()
+    cur = dbcon.get_cursor()
+    try:
+        return int(header.get('graph_publications', -1)) == dbcon.count_publications() and \
+            int(header.get('graph_citations', -1)) == cur.execute(SQL_COUNT_EDGES).fetchone()[0]
+    except ValueError:
+        return False
+
+
+def update_metrics(dbcon, refresh=False):
+    '''
+    Compute and store the graph metrics if the stored ones are missing or
+    out of date. Returns the graph, or None if nothing was computed.
+    '''
+    if not refresh and up_to_date(dbcon):
+        return None
+    if numpy is None:
+        raise GraphError('The graph metrics require numpy (pip install numpy)')
+    graph = CitationGraph.load(dbcon)
+    graph.save(dbcon)
+    dbcon.commit()
+    logger.info('Graph metrics stored: %d publications, %d citations' % (graph.n, graph.edges))
+    return graph
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1].startswith('-'):
+        print __doc__[__doc__.index('Usage:'):]
+        return 2
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    if not os.path.exists(sys.argv[1]):
+        logger.error('%s does not exist' % sys.argv[1])
+        return 1
+
+    dbcon = DBConnection(sys.argv[1])
+    dbcon.open()
+    try:
+        update_metrics(dbcon, "-refresh" in sys.argv)
+        cur = dbcon.get_cursor()
+        header = dbcon.read_header()
+        print '%-14s %10s' % ('publications', header['graph_publications'])
+        print '%-14s %10s' % ('citations', header['graph_citations'])
+        print
+        print '%-14s %10s %10s' % ('level', 'pubs', 'citations')
+        for level, pubs, cites in cur.execute('select * from GraphLevels order by Level;').fetchall():
+            print '%-14d %10d %10d' % (level, pubs, cites)
+        top = int(get_arg('-top', 10))
+        for column in ('PageRank', 'InDegree'):
+            print
+            print 'Top %d by %s' % (top, column)
+            for pubid, title, year, indegree, pagerank in cur.execute(SQL_TOP % column, (top,)).fetchall():
+                print '%10.6f %6d  %s (%s)' % (pagerank, indegree, (title or pubid)[:60].encode('utf-8'), year or '?')
+    except GraphError, e:
+        logger.error(e)
+        return 1
+    finally:
+        dbcon.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+'''
+citenet - Citation Network Analyzer
+Copyright (C) 2015 Jesse Lecy <jdlecy@gmail.com>, with contributions from
+Diego Moreda <diego.plan9@gmail.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along
+with this program; if not, write to the Free Software Foundation, Inc.,
+51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+Search from the command line, without Qt. Usage:
+
+    python -m citenet crawl DB [QUERY] [-seeds LIST] [-list] [-force]
+                               [-ppl P | -maxpl N] [-levels N] [-budget N]
+                               [-inflight N] [-rate R] [-policy P]
+                               [-dedupcache N] [-cache PATH | -nocache]
+                               [-offline] [-scholarurl URL]
+                               [-cookies PATH | -nocookies]
+                               [-metrics PATH] [-metricsport PORT]
+
+With a QUERY, a new search is created in DB, with the seeds taken from the
+results of the query: -seeds gives their positions, as a list of numbers
+and ranges (e.g. 1-5,8; the first 10 results by default). -list only shows
+the numbered results. An existing DB is only replaced with -force.
+
+The citations of each publication are collected up to -levels levels (2 by
+default), either -ppl percent of them or at most -maxpl (10 by default).
+Without QUERY, the search stored in DB is resumed. The search stops after
+-budget requests (no limit by default), and can be resumed later.
+
+-metrics appends the counters and timers of the crawl stages to PATH every
+-metricsinterval seconds (10 by default), and -metricsport serves them for
+Prometheus on http://127.0.0.1:PORT/metrics (see citenet/metrics.py).
+'''
+
+import logging
+import os
+import sys
+import time
+
+from cache import DEFAULT_PATH, ResponseCache
+from cmdline import get_arg
+from crawler import Blocked, Crawl, Session
+from db import DBConnection
+from fetcher import COOKIES_PATH, SCHOLAR_URL, FetchError, NotCached
+from frontier import DEFAULT_POLICY, POLICIES
+import metrics
+from shard import MAX_ERRORS, Backoff
+
+logger = logging.getLogger('main')
+
+DEFAULT_SEEDS = '1-10'
+# results on each page of a search
+PAGE_SIZE = 10
+
+
+def parse_seeds(spec):
+    '''
+    Sorted positions (1-based) in a list like "1-5,8"
+    '''
+    positions = set()
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition('-')
+        first = int(first)
+        last = int(last) if last else first
+        if first < 1 or last < first:
+            raise ValueError('invalid range %s' % part)
+        positions.update(xrange(first, last + 1))
+    if not positions:
+        raise ValueError('no seeds given')
+    return sorted(positions)
+
+
+class HeadlessCrawl(object):
+    '''
+    A search run in this process: the seed search, then the citations of
+    every publication in the frontier, waiting after captchas and blocks
+    '''
+    def __init__(self, session, budget=None):
+        self.session = session
+        self.budget = budget   # requests allowed, for all the searches run
+        self.backoff = Backoff()
+
+    def exhausted(self):
+        return self.budget is not None and self.session.fetcher.requests >= self.budget
+
+    def retry(self, f, *args):
+        '''
+        Call f until it succeeds, waiting after each failure. Pages missing
+        from the cache while offline, and MAX_ERRORS network errors in a
+        row, are raised as FetchError.
+        '''
+        errors = 0
+        while True:
+            try:
+                r = f(*args)
+                self.backoff.reset()
+                return r
+            except Blocked, e:
+                delay = self.backoff.delay(e.kind)
+                logger.warning('%s found, waiting %d seconds' % (e.kind.capitalize(), delay))
+            except NotCached:
+                raise
+            except FetchError, e:
+                errors += 1
+                if errors >= MAX_ERRORS:
+                    raise
+                delay = self.backoff.delay()
+                logger.warning('Error fetching %s, waiting %d seconds' % (e, delay))
+            metrics.observe('backoff', delay)
+            time.sleep(delay)
+
+    def candidates(self, query, count):
+        '''
+        The first count results of query (without their BibTeX entries)
+        '''
+        results = []
+        start = 0
+        while len(results) < count:
+            page = self.retry(self.session.search_results, query, start)
+            if not page:
+                break
+            results.extend(page)
+            start += PAGE_SIZE
+        return results[:count]
+
+    def seeds(self, results):
+        '''
+        Publications of the results chosen as seeds
+        '''
+        return self.retry(self.session.entries, results)
+
+    def run(self, crawl):
+        '''
+        Collect the citations until the frontier of crawl is exhausted, or
+        the budget is. Returns whether the search is done.
+        '''
+        while True:
+            if self.exhausted():
+                logger.info('Budget of %d requests used' % self.budget)
+                return False
+            r = crawl.next_parent()
+            if r is None:
+                return crawl.scrape_done
+            item, pub = r
+            max_progress = crawl.max_progress(pub[4])
+            offset = item.offset
+            done = not pub[0] or offset >= max_progress
+            pubs = []
+            found = 0
+            while True:
+                if not done:
+                    pubs, offset, done = self.retry(self.session.citations,
+                                                    pub[0], offset, max_progress)
+                    found += len(pubs)
+                crawl.rate_state = self.session.rate_control.state()
+                if crawl.save_publications(pubs, item.level + 1, item, offset, done) is None:
+                    logger.error('Can not save the publications citing %s' % item.pubid)
+                if done:
+                    break
+            logger.info('Level %d: %d publications citing %s (%d records)' %
+                        (item.level + 1, found, pub[2] or item.pubid, crawl.total_records))
+
+
+def new_header(query, seeds, levels=2, maxpl=10, ppl=None, policy=None):
+    '''
+    Header of a new search: ppl percent of the citations of each
+    publication if given, otherwise at most maxpl of them
+    '''
+    return dict(query=query,
+                ppl=str(ppl or 100),
+                max_number=str(ppl or 100),
+                maxpl=str(maxpl),
+                max_level=str(int(levels) + 1),
+                current_level='1',
+                current_row='0',
+                progress='0',
+                scrape_done='0',
+                level_limit=str(len(seeds)),
+                use_percent='1' if ppl is not None else '0',
+                policy=policy or DEFAULT_POLICY)
+
+
+def open_session():
+    '''
+    Session and response cache set up from the command line options
+    '''
+    cache = None
+    if "-nocache" not in sys.argv:
+        cache = ResponseCache(get_arg("-cache", DEFAULT_PATH))
+    session = Session(get_arg("-scholarurl", SCHOLAR_URL), int(get_arg("-inflight", 4)),
+                      float(get_arg("-rate", 1)), cache, "-offline" in sys.argv,
+                      None if "-nocookies" in sys.argv else get_arg("-cookies", COOKIES_PATH))
+    return session, cache
+
+
+def get_budget():
+    budget = get_arg("-budget")
+    return int(budget) if budget is not None else None
+
+
+def metrics_reporter():
+    '''
+    Outputs of the metrics given on the command line
+    '''
+    return metrics.Reporter(get_arg("-metrics"), get_arg("-metricsport"),
+                            get_arg("-metricsinterval", 10))
+
+
+def run_search(path, query, positions, policy):
+    '''
+    Create (with a query) or resume the search in path, or only list the
+    results of the query with -list. Returns the exit status.
+    '''
+    session, cache = open_session()
+    headless = HeadlessCrawl(session, get_budget())
+    headless.retry(session.start)
+
+    if query is not None:
+        results = headless.candidates(query, positions[-1])
+        if "-list" in sys.argv:
+            for i, pub in enumerate(headless.seeds(results)):
+                print (u'%3d. %s, %s (%s), cited %s times' % (
+                    i + 1, pub.get('title', ''), pub.get('author', ''),
+                    pub.get('year', '?'), pub.get('citedby') or 0)).encode('utf-8')
+            return 0
+        seeds = headless.seeds([results[i - 1] for i in positions if i <= len(results)])
+        if not seeds:
+            logger.error('No seeds found for "%s"' % query)
+            return 1
+
+    dbcon = DBConnection(path)
+    dbcon.open()
+    crawl = Crawl(dbcon, int(get_arg("-dedupcache", 100000)))
+    try:
+        if query is not None:
+            crawl.create(new_header(query, seeds, get_arg('-levels', 2), get_arg('-maxpl', 10),
+                                    get_arg('-ppl'), policy), seeds)
+            logger.info('Search created with %d seeds' % len(seeds))
+        else:
+            crawl.open()
+        header = crawl.load(policy)
+        if crawl.scrape_done:
+            logger.info('Scrape for this query is already finished')
+            return 0
+        # continue at the rate learned on previous sessions
+        session.rate_control.restore(header)
+        session.rate_control.apply(session.fetcher)
+        done = headless.run(crawl)
+        logger.info('%d records, scrape %s' % (crawl.total_records,
+                                               'done' if done else 'not finished'))
+    except KeyboardInterrupt:
+        logger.info('Search stopped; resume it with python -m citenet crawl %s' % path)
+        return 1
+    finally:
+        crawl.close()
+        if cache is not None:
+            cache.close()
+    return 0
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1].startswith('-'):
+        print __doc__[__doc__.index('Usage:'):]
+        return 2
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    path = sys.argv[1]
+    query = None
+    if len(sys.argv) > 2 and not sys.argv[2].startswith('-'):
+        query = sys.argv[2].decode(sys.getfilesystemencoding() or 'utf-8')
+    policy = get_arg('-policy')
+    if policy is not None and policy not in POLICIES:
+        logger.error('Unknown policy "%s" (%s)' % (policy, ', '.join(sorted(POLICIES))))
+        return 2
+
+    if query is None and not os.path.exists(path):
+        logger.error('%s does not exist; give a query to start a new search' % path)
+        return 1
+    if query is not None and os.path.exists(path) and \
+            "-list" not in sys.argv and "-force" not in sys.argv:
+        logger.error('%s already exists; use -force to replace it' % path)
+        return 1
+    try:
+        positions = parse_seeds(get_arg('-seeds', DEFAULT_SEEDS))
+    except ValueError, e:
+        logger.error('Invalid -seeds: %s' % e)
+        return 2
+
+    reporter = metrics_reporter()
+    try:
+        return run_search(path, query, positions, policy)
+    except FetchError, e:
+        logger.error('Search stopped: %s' % e)
+        return 1
+    finally:
+        reporter.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+'''
+citenet - Citation Network Analyzer
+Copyright (C) 2015 Jesse Lecy <jdlecy@gmail.com>, with contributions from
+Diego Moreda <diego.plan9@gmail.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along
+with this program; if not, write to the Free Software Foundation, Inc.,
+51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+Logging off the calling thread: records are put on a bounded queue by
+QueueHandler, and handed to the actual handlers (files, console, log
+window) by a QueueListener thread, so logging costs the caller the same
+however slow the handlers are.
+'''
+
+import gzip
+import logging
+from logging.handlers import RotatingFileHandler
+import os
+import Queue
+import shutil
+import threading
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.citenet.log')
+# records waiting for the listener, before the minor ones are dropped
+QUEUE_SIZE = 10000
+
+
+class QueueHandler(logging.Handler):
+    '''
+    Puts the records on a queue, with their message and traceback already
+    formatted. While the queue is full, records below WARNING are dropped
+    (and counted), the others wait for room.
+    '''
+    def __init__(self, queue):
+        logging.Handler.__init__(self)
+        self.queue = queue
+        self.dropped = 0
+
+    def prepare(self, record):
+        # the arguments may change, or not be picklable, once queued
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def emit(self, record):
+        try:
+            record = self.prepare(record)
+            if record.levelno >= logging.WARNING:
+                self.queue.put(record)
+            else:
+                self.queue.put_nowait(record)
+        except Queue.Full:
+            self.dropped += 1
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except:
+            self.handleError(record)
+
+
+class QueueListener(object):
+    '''
+    Thread handing the records of a queue to the handlers, each one only
+    given the records of its level or above
+    '''
+    def __init__(self, queue, handlers, source=None):
+        self.queue = queue
+        self.handlers = handlers
+        self.source = source   # QueueHandler, for reporting dropped records
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        reported = 0
+        while True:
+            record = self.queue.get()
+            if record is None:
+                break
+            if self.source is not None and self.source.dropped > reported:
+                self.dispatch(logging.makeLogRecord(dict(
+                    name=record.name, levelno=logging.WARNING, levelname='WARNING',
+                    msg='%d log messages dropped' % (self.source.dropped - reported))))
+                reported = self.source.dropped
+            self.dispatch(record)
+
+    def dispatch(self, record):
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def stop(self):
+        '''
+        Handle the records still queued, then stop the thread
+        '''
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+        for handler in self.handlers:
+            handler.flush()
+
+
+class GzipRotatingFileHandler(RotatingFileHandler):
+    '''
+    RotatingFileHandler that compresses the files rotated out (log.1.gz,
+    log.2.gz, ...)
+    '''
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        for i in xrange(self.backupCount - 1, 0, -1):
+            src = '%s.%d.gz' % (self.baseFilename, i)
+            dst = '%s.%d.gz' % (self.baseFilename, i + 1)
+            if os.path.exists(src):
+                if os.path.exists(dst):
+                    os.remove(dst)
+                os.rename(src, dst)
+        if self.backupCount > 0 and os.path.exists(self.baseFilename):
+            dst = self.baseFilename + '.1.gz'
+            with open(self.baseFilename, 'rb') as f_in:
+                f_out = gzip.open(dst, 'wb')
+                try:
+                    shutil.copyfileobj(f_in, f_out)
+                finally:
+                    f_out.close()
+            os.remove(self.baseFilename)
+        self.mode = 'a'
+        self.stream = self._open()
+
+
+def start(logger, handlers, size=QUEUE_SIZE):
+    '''
+    Send the records of logger to the handlers through a queue. Returns
+    the running QueueListener (to be stopped on exit).
+    '''
+    queue = Queue.Queue(size)
+    source = QueueHandler(queue)
+    logger.addHandler(source)
+    listener = QueueListener(queue, handlers, source)
+    listener.start()
+    return listener
@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+'''
+citenet - Citation Network Analyzer
+Copyright (C) 2015 Jesse Lecy <jdlecy@gmail.com>, with contributions from
+Diego Moreda <diego.plan9@gmail.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along
+with this program; if not, write to the Free Software Foundation, Inc.,
+51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+Counters and timers of the stages of a crawl (network, parsing, database),
+kept for the whole process:
+
+    import metrics
+    metrics.count('pages')
+    with metrics.timer('network'):
+        ...
+
+They can be written to a file, one JSON object per line (-metrics PATH,
+every -metricsinterval seconds), and served in the Prometheus text format
+on http://127.0.0.1:PORT/metrics (-metricsport PORT).
+'''
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger('main')
+
+PREFIX = 'citenet_'
+
+
+class Timer(object):
+    '''
+    Context manager adding the time spent in its block to a timer
+    '''
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.time() - self.start)
+
+
+class Metrics(object):
+    '''
+    Counters, and timers (number of times, total and longest seconds) by
+    name. Safe to share between threads.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.counters = dict()
+        self.timers = dict()
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name, seconds):
+        with self.lock:
+            t = self.timers.get(name)
+            if t is None:
+                self.timers[name] = [1, seconds, seconds]
+            else:
+                t[0] += 1
+                t[1] += seconds
+                if seconds > t[2]:
+                    t[2] = seconds
+
+    def timer(self, name):
+        return Timer(self, name)
+
+    def snapshot(self):
+        '''
+        Current values, as a dict that can be dumped to JSON
+        '''
+        with self.lock:
+            return self._snapshot()
+
+    def _snapshot(self):
+        now = time.time()
+        return dict(time=round(now, 3),
+                    uptime=round(now - self.started, 3),
+                    counters=dict(self.counters),
+                    timers=dict((k, dict(count=c, seconds=round(s, 6), max=round(m, 6)))
+                                for k, (c, s, m) in self.timers.items()))
+
+    def take(self):
+        '''
+        Snapshot of the values since the last one taken, e.g. to be merged
+        into the metrics of another process
+        '''
+        with self.lock:
+            snap = self._snapshot()
+            self.counters.clear()
+            self.timers.clear()
+            return snap
+
+    def merge(self, snap):
+        '''
+        Add the values of a snapshot taken elsewhere
+        '''
+        with self.lock:
+            for name, value in snap['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            for name, v in snap['timers'].items():
+                t = self.timers.get(name)
+                if t is None:
+                    self.timers[name] = [v['count'], v['seconds'], v['max']]
+                else:
+                    t[0] += v['count']
+                    t[1] += v['seconds']
+                    t[2] = max(t[2], v['max'])
+
+    def prometheus(self):
+        '''
+        Current values in the Prometheus text exposition format
+        '''
+        snap = self.snapshot()
+        lines = ['# TYPE %suptime_seconds gauge' % PREFIX,
+                 '%suptime_seconds %s' % (PREFIX, snap['uptime'])]
+        for name, value in sorted(snap['counters'].items()):
+            lines.append('# TYPE %s%s_total counter' % (PREFIX, name))
+            lines.append('%s%s_total %s' % (PREFIX, name, value))
+        for name, t in sorted(snap['timers'].items()):
+            metric = PREFIX + name + '_seconds'
+            lines.append('# TYPE %s summary' % metric)
+            lines.append('%s_count %d' % (metric, t['count']))
+            lines.append('%s_sum %s' % (metric, t['seconds']))
+            lines.append('# TYPE %s_max gauge' % metric)
+            lines.append('%s_max %s' % (metric, t['max']))
+        return '\n'.join(lines) + '\n'
+
+
+# the metrics of this process
+METRICS = Metrics()
+count = METRICS.count
+observe = METRICS.observe
+timer = METRICS.timer
+snapshot = METRICS.snapshot
+take = METRICS.take
+merge = METRICS.merge
+
+
+class MetricsFile(object):
+    '''
+    Appends a snapshot of the metrics to a file every interval seconds, as
+    a line of JSON, and a last one when closed
+    '''
+    def __init__(self, path, interval=10, metrics=METRICS):
+        self.path = path
+        self.interval = interval
+        self.metrics = metrics
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def write(self):
+        try:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(self.metrics.snapshot(), sort_keys=True) + '\n')
+        except IOError, e:
+            logger.warning('Can not write the metrics to %s: %s' % (self.path, e))
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+        self.write()
+
+
+class MetricsServer(object):
+    '''
+    Serves the metrics in the Prometheus format on /metrics, from a
+    background thread
+    '''
+    def __init__(self, port, host='127.0.0.1', metrics=METRICS):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = HTTPServer((host, port), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        logger.info('Metrics served on http://%s:%d/metrics' % (host, self.server.server_port))
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class Reporter(object):
+    '''
+    The outputs of the metrics asked for: a JSON lines file if path is
+    given, a Prometheus endpoint if port is
+    '''
+    def __init__(self, path=None, port=None, interval=10):
+        self.outputs = []
+        if path:
+            self.outputs.append(MetricsFile(path, float(interval)))
+        if port:
+            try:
+                self.outputs.append(MetricsServer(int(port)))
+            except Exception, e:
+                logger.warning('Can not serve the metrics on port %s: %s' % (port, e))
+
+    def close(self):
+        for output in self.outputs:
+            output.close()
+        self.outputs = []
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+'''
+citenet - Citation Network Analyzer
+Copyright (C) 2015 Jesse Lecy <jdlecy@gmail.com>, with contributions from
+Diego Moreda <diego.plan9@gmail.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along
+with this program; if not, write to the Free Software Foundation, Inc.,
+51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+'''
+
+import logging
+
+logger = logging.getLogger('main')
+
+
+class RateController(object):
+    '''
+    AIMD control of the request rate and concurrency: both grow slowly
+    while the pages load fine (additive increase), and are cut on every
+    403 page, captcha or block (multiplicative decrease, harder the worse
+    the signal). The rate never goes over max_rate nor the concurrency over
+    max_in_flight, the politeness budget given by the user. A max_rate of 0
+    means no limit, and disables the control.
+    '''
+    INCREASE = 0.01     # requests per second added after each valid page
+    WINDOW   = 20       # valid pages before allowing one more in flight
+    MIN_RATE = 0.02     # one request every 50 seconds
+    DECREASE = dict(forbidden=0.5, captcha=0.25, block=0.125)
+
+    def __init__(self, max_rate=1.0, max_in_flight=4):
+        self.max_rate = max_rate
+        self.max_in_flight = max_in_flight
+        self.rate = max_rate
+        self.in_flight = max_in_flight
+        self.successes = 0
+
+    def observe(self, kind, n=1):
+        '''
+        Account for n pages classified as kind (see scraper.classify_page)
+        '''
+        if not self.max_rate:
+            return
+        if kind is None:
+            for _ in xrange(n):
+                self.success()
+        elif kind in self.DECREASE:
+            self.failure(kind)
+
+    def success(self):
+        self.rate = min(self.rate + self.INCREASE, self.max_rate)
+        self.successes += 1
+        if self.successes >= self.WINDOW:
+            self.successes = 0
+            self.in_flight = min(self.in_flight + 1, self.max_in_flight)
+
+    def failure(self, kind):
+        self.rate = max(self.rate * self.DECREASE[kind], self.MIN_RATE)
+        self.in_flight = max(self.in_flight // 2, 1)
+        self.successes = 0
+        logger.info('Request rate lowered to %.3f/s, %d in flight' % (self.rate, self.in_flight))
+
+    def delay(self):
+        '''
+        Seconds between requests at the current rate
+        '''
+        if not self.rate:
+            return 0
+        return 1.0 / self.rate
+
+    def apply(self, fetcher):
+        fetcher.limiter.rate = self.rate
+        fetcher.max_in_flight = self.in_flight
+
+    def state(self):
+        '''
+        State to be stored in the header of the result database
+        '''
+        return dict(rate='%.4f' % self.rate, in_flight=self.in_flight)
+
+    def restore(self, header):
+        '''
+        Continue at the rate stored in a header, if any
+        '''
+        try:
+            if 'rate' in header and self.max_rate:
+                self.rate = min(max(float(header['rate']), self.MIN_RATE), self.max_rate)
+            if 'in_flight' in header:
+                self.in_flight = min(max(int(header['in_flight']), 1), self.max_in_flight)
+        except ValueError:
+            logger.warning('Invalid rate in the database, using the default')
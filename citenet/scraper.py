@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+'''
+citenet - Citation Network Analyzer
+Copyright (C) 2015 Jesse Lecy <jdlecy@gmail.com>, with contributions from
+Diego Moreda <diego.plan9@gmail.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along
+with this program; if not, write to the Free Software Foundation, Inc.,
+51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+'''
+
+from collections import namedtuple
+from HTMLParser import HTMLParser
+import re
+import urllib
+from urlparse import parse_qs, urlparse
+
+_parser = HTMLParser()
+
+RE_FORM     = re.compile(r'<form\b([^>]*)>(.*?)</form>', re.I | re.S)
+RE_INPUT    = re.compile(r'<input\b([^>]*)>', re.I)
+RE_SELECT   = re.compile(r'<select\b([^>]*)>(.*?)</select>', re.I | re.S)
+RE_OPTION   = re.compile(r'<option\b([^>]*)>', re.I)
+RE_ATTR     = re.compile(r'([\w:-]+)(?:\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+)))?')
+RE_SCRIPT   = re.compile(r'<(script|style)\b.*?</\1\s*>', re.I | re.S)
+RE_TAG      = re.compile(r'<[^>]*>')
+RE_CAPTCHA  = re.compile(r'\bid\s*=\s*["\']?[^"\'\s>]*captcha', re.I)
+RE_CITED_BY = re.compile(r'Cited by\s+(\d+)')
+RE_RELATED  = re.compile(r'related:([^:]+):')
+
+Result = namedtuple('Result', ['bibtex_url', 'cites', 'citedby', 'related'])
+
+
+class ResultsParser(HTMLParser):
+    '''
+    Single pass over a Scholar result page, producing a Result for each
+    result footer (<div class="gs_fl">) with the links found in it
+    '''
+    def __init__(self):
+        HTMLParser.__init__(self)
+        self.results = []
+        self.depth = 0        # nesting of divs inside the current footer
+        self.href = None      # href of the current anchor inside a footer
+        self.text = []
+        self.current = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'div':
+            if self.depth:
+                self.depth += 1
+            elif dict(attrs).get('class') == 'gs_fl':
+                self.depth = 1
+                self.current = dict(bibtex_url='', cites='', citedby=0, related='')
+        elif tag == 'a' and self.depth:
+            self.href = dict(attrs).get('href') or ''
+            self.text = []
+
+    def handle_endtag(self, tag):
+        if tag == 'div' and self.depth:
+            self.depth -= 1
+            if self.depth == 0:
+                self.results.append(Result(**self.current))
+                self.current = None
+        elif tag == 'a' and self.href is not None:
+            self.anchor(self.href, u''.join(self.text).strip())
+            self.href = None
+
+    def handle_data(self, data):
+        if self.href is not None:
+            self.text.append(data)
+
+    def handle_entityref(self, name):
+        self.handle_data(self.unescape('&%s;' % name))
+
+    def handle_charref(self, name):
+        self.handle_data(self.unescape('&#%s;' % name))
+
+    def anchor(self, href, text):
+        r = self.current
+        if text == 'Import into BibTeX':
+            r['bibtex_url'] = href
+        elif 'Cited by' in text and not r['cites']:
+            r['cites'] = parse_qs(urlparse(href).query).get('cites', [''])[0]
+            m = RE_CITED_BY.search(text)
+            if m is not None:
+                r['citedby'] = int(m.group(1))
+        elif 'Related articles' in text and not r['related']:
+            m = RE_RELATED.search(urllib.unquote(href))
+            if m is not None:
+                r['related'] = m.group(1)
+
+
+def unescape(s):
+    return _parser.unescape(s)
+
+
+def attributes(s):
+    '''
+    Parse the attributes of a tag into a dict (lowercase names)
+    '''
+    res = dict()
+    for m in RE_ATTR.finditer(s):
+        v = m.group(2)
+        if v is None:
+            v = m.group(3)
+        if v is None:
+            v = m.group(4)
+        if v is None:
+            v = ''
+        res[m.group(1).lower()] = unescape(v)
+    return res
+
+
+def html_to_text(html):
+    text = RE_SCRIPT.sub(' ', html)
+    text = RE_TAG.sub(' ', text)
+    return unescape(text)
+
+
+def parse_results(html):
+    '''
+    List of Result (BibTeX url, cites id, cited by count, related id) for the
+    results in a page
+    '''
+    parser = ResultsParser()
+    parser.feed(html)
+    parser.close()
+    return parser.results
+
+
+def settings_prefs_url(html):
+    '''
+    Url for submitting the Scholar settings form with the "Import into
+    BibTeX" links enabled, or None if the form could not be found
+    '''
+    for m in RE_FORM.finditer(html):
+        body = m.group(2)
+        if not re.search(r'name\s*=\s*["\']?scis\b', body):
+            continue
+
+        params = []
+        for i in RE_INPUT.finditer(body):
+            a = attributes(i.group(1))
+            name = a.get('name')
+            t = a.get('type', 'text').lower()
+            if not name or name in ('scis', 'scisf'):
+                continue
+            if t in ('radio', 'checkbox') and 'checked' not in a:
+                continue
+            if t in ('submit', 'button', 'image', 'reset'):
+                continue
+            params.append((name, a.get('value', '')))
+
+        for s in RE_SELECT.finditer(body):
+            name = attributes(s.group(1)).get('name')
+            if not name or name == 'scisf':
+                continue
+            options = [attributes(o.group(1)) for o in RE_OPTION.finditer(s.group(2))]
+            selected = [o for o in options if 'selected' in o] or options[:1]
+            if selected:
+                params.append((name, selected[0].get('value', '')))
+
+        params += [('scis', 'yes'), ('scisf', '4'), ('save', '')]
+        action = attributes(m.group(1)).get('action', '/scholar_setprefs')
+        return action + '?' + urllib.urlencode(
+            [(k, v.encode('utf-8')) for k, v in params])
+
+    return None
+
+
+def classify_page(url, html, text):
+    '''
+    Classify an invalid page as 'captcha', 'block' or 'forbidden'. Pages that
+    look suspicious but can not be confirmed are returned as 'suspect', and
+    valid pages as None.
+    '''
+    if 'sorry' in url or\
+       'but your computer or network may be sending automated queries' in text or\
+       '/+/+/+/+/+' in text or\
+       'not a robot' in text or\
+       RE_CAPTCHA.search(html):
+        if RE_CAPTCHA.search(html):
+            return 'captcha'
+        elif 'sorry' in url or\
+             'but your computer or network may be sending automated queries' in text:
+            return 'block'
+        elif '/+/+/+/+/+' in text:
+            return 'forbidden'
+        return 'suspect'
+    return None
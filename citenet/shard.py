@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+'''
+citenet - Citation Network Analyzer
+Copyright (C) 2015 Jesse Lecy <jdlecy@gmail.com>, with contributions from
+Diego Moreda <diego.plan9@gmail.com>
+
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License along
+with this program; if not, write to the Free Software Foundation, Inc.,
+51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+Crawl of the frontier of a search split across several worker processes.
+Usage:
+
+    python -m citenet.shard DB [-workers N] [-inflight N] [-rate R]
+                               [-policy P] [-dedupcache N]
+                               [-cache PATH | -nocache] [-offline]
+                               [-scholarurl URL] [-cookies PATH | -nocookies]
+                               [-metrics PATH] [-metricsport PORT]
+
+Each worker has its own HTTP session (cookies and request rate) and backs
+off on its own when Scholar answers with a captcha or a block. Workers only
+retrieve pages: the publications are sent back to the coordinator, which
+is the single writer of the result database. The metrics of the workers
+are sent along, and reported by the coordinator as in the crawl command.
+'''
+
+import logging
+import multiprocessing
+import Queue
+import random
+import sys
+import time
+
+from cache import DEFAULT_PATH, ResponseCache
+from cmdline import get_arg
+from crawler import Blocked, Crawl, Session
+from db import DBConnection
+from fetcher import COOKIES_PATH, SCHOLAR_URL, FetchError, NotCached
+import metrics
+
+logger = logging.getLogger('main')
+
+# minutes to wait after a captcha or a block, as in the GUI
+TIMEOUT_CAPTCHA = 60*5
+TIMEOUT_BLOCK   = 60*6
+# network errors in a row before giving up
+MAX_ERRORS = 10
+# workers started again after dying, in a run
+MAX_RESTARTS = 5
+
+
+class Backoff(object):
+    '''
+    Waiting time of a worker after a failed request, growing with the
+    number of consecutive failures
+    '''
+    def __init__(self, captcha=TIMEOUT_CAPTCHA, block=TIMEOUT_BLOCK):
+        self.timeouts = dict(captcha=captcha, block=block, forbidden=1)
+        self.attempts = 0
+
+    def reset(self):
+        self.attempts = 0
+
+    def delay(self, kind=None):
+        '''
+        Seconds to wait after a failure of the given kind (None for
+        network errors)
+        '''
+        self.attempts += 1
+        if kind is None:
+            return min(2 ** self.attempts, 300) + random.random()
+        return (self.timeouts[kind] + (self.attempts - 1) * 30) * 60
+
+
+def worker(n, options, tasks, results):
+    '''
+    Worker process: collect the citations of the publications received in
+    tasks, page by page, sending each page back through results. Each task
+    taken is announced first, so the coordinator can hand it out again if
+    the worker dies. Pages missing from the cache while offline, and
+    MAX_ERRORS network errors in a row, stop the worker, and are sent back
+    as a failure.
+    '''
+    cache = None
+    if options['cache'] is not None:
+        cache = ResponseCache(options['cache'])
+    cookies = None
+    if options['cookies'] is not None:
+        # each worker is a separate Scholar session, kept by the workers
+        # started again in its place
+        cookies = '%s.%d' % (options['cookies'], n % options['workers'])
+    session = Session(options['base_url'], options['inflight'], options['rate'],
+                      cache, options['offline'], cookies)
+    session.rate_control.restore(options['rate_state'])
+    session.rate_control.apply(session.fetcher)
+    backoff = Backoff()
+
+    def retry(f, *args):
+        errors = 0
+        while True:
+            try:
+                r = f(*args)
+                backoff.reset()
+                return r
+            except Blocked, e:
+                delay = backoff.delay(e.kind)
+                results.put(('blocked', n, e.kind, delay))
+            except NotCached:
+                raise
+            except FetchError, e:
+                errors += 1
+                if errors >= MAX_ERRORS:
+                    raise
+                delay = backoff.delay()
+                results.put(('error', n, str(e), delay))
+            time.sleep(delay)
+
+    pubid = None
+    try:
+        retry(session.start)
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            pubid, cites, offset, max_progress = task
+            results.put(('taken', n, pubid))
+            done = False
+            while not done:
+                pubs, offset, done = retry(session.citations, cites, offset, max_progress)
+                results.put(('page', n, pubid, pubs, offset, done,
+                             session.rate_control.state(), metrics.take()))
+            pubid = None
+    except FetchError, e:
+        results.put(('failed', n, pubid, str(e)))
+
+
+class Coordinator(object):
+    '''
+    Hands out the frontier of a search to the workers and writes what they
+    find. Each worker has at most one publication assigned at a time.
+    '''
+    def __init__(self, crawl, workers=2, base_url=SCHOLAR_URL, inflight=4, rate=1,
+                 cache=DEFAULT_PATH, offline=False, cookies=COOKIES_PATH):
+        self.crawl = crawl
+        self.workers = workers
+        self.options = dict(base_url=base_url, inflight=inflight, rate=rate,
+                            cache=cache, offline=offline, cookies=cookies,
+                            workers=workers, rate_state=dict())
+        self.assigned = dict()   # pubid -> frontier item
+        self.taken = dict()      # worker -> pubid it is working on
+        self.rates = dict()      # worker -> last rate state reported
+        self.procs = dict()      # worker -> process
+        self.restarts = 0
+
+    def assign(self, tasks):
+        '''
+        Give out frontier items until every worker has one, or the frontier
+        has nothing else to hand out
+        '''
+        while len(self.assigned) < self.workers:
+            r = self.crawl.next_parent()
+            if r is None:
+                return
+            item, pub = r
+            max_progress = self.crawl.max_progress(pub[4])
+            if not pub[0] or item.offset >= max_progress:
+                # nothing to retrieve
+                self.crawl.save_publications([], item.level + 1, item, item.offset, True)
+                continue
+            self.assigned[item.pubid] = item
+            tasks.put((item.pubid, pub[0], item.offset, max_progress))
+
+    def rate_state(self):
+        '''
+        Mean rate of the workers, stored so the next run starts from it
+        '''
+        states = self.rates.values()
+        return dict(rate='%.4f' % (sum(float(s['rate']) for s in states) / len(states)),
+                    in_flight=sum(s['in_flight'] for s in states) // len(states))
+
+    def start_worker(self, n, tasks, results):
+        p = multiprocessing.Process(target=worker, args=(n, self.options, tasks, results))
+        p.daemon = True
+        p.start()
+        self.procs[n] = p
+
+    def check_workers(self, tasks, results):
+        '''
+        Hand out again the publication of each worker that died, and start
+        another worker in its place (at most MAX_RESTARTS times). Returns
+        whether any worker is left.
+        '''
+        for n, p in self.procs.items():
+            if p.is_alive():
+                continue
+            del self.procs[n]
+            self.rates.pop(n, None)
+            pubid = self.taken.pop(n, None)
+            logger.error('Worker %d stopped (exit code %s)%s' %
+                         (n, p.exitcode, ' working on %s' % pubid if pubid else ''))
+            if pubid in self.assigned:
+                # the progress saved so far is kept
+                self.crawl.frontier.release(self.assigned.pop(pubid))
+            if self.restarts < MAX_RESTARTS:
+                self.restarts += 1
+                self.start_worker(n + self.workers, tasks, results)
+        if self.procs:
+            self.assign(tasks)
+        return bool(self.procs)
+
+    def run(self, header=None):
+        '''
+        Crawl until the frontier is exhausted, with the workers starting at
+        the rate stored in header. A worker failing (see worker) stops the
+        crawl, raising FetchError.
+        '''
+        self.options['rate_state'] = header or dict()
+        tasks = multiprocessing.Queue()
+        results = multiprocessing.Queue()
+        for n in xrange(self.workers):
+            self.start_worker(n, tasks, results)
+
+        try:
+            self.assign(tasks)
+            while self.assigned:
+                if not self.check_workers(tasks, results):
+                    logger.error('All the workers have stopped')
+                    break
+                try:
+                    msg = results.get(timeout=5)
+                except Queue.Empty:
+                    continue
+
+                if msg[0] == 'taken':
+                    self.taken[msg[1]] = msg[2]
+                elif msg[0] == 'failed':
+                    n, pubid, what = msg[1:]
+                    if pubid in self.assigned:
+                        self.crawl.frontier.release(self.assigned.pop(pubid))
+                    raise FetchError('Worker %d: %s' % (n, what))
+                elif msg[0] == 'page':
+                    n, pubid, pubs, offset, done, rate, stats = msg[1:]
+                    metrics.merge(stats)
+                    if self.taken.get(n) != pubid:
+                        # from a worker already given up for dead
+                        continue
+                    self.rates[n] = rate
+                    self.crawl.rate_state = self.rate_state()
+                    item = self.assigned[pubid]
+                    if self.crawl.save_publications(pubs, item.level + 1, item, offset, done) is None:
+                        logger.error('Can not save the publications citing %s' % pubid)
+                    if done:
+                        del self.assigned[pubid]
+                        del self.taken[n]
+                        self.assign(tasks)
+                    logger.info('Worker %d: %d publications citing %s (%d records)' %
+                                (n, len(pubs), pubid, self.crawl.total_records))
+                else:
+                    kind, n, what, delay = msg
+                    metrics.observe('backoff', delay)
+                    logger.warning('Worker %d: %s (%s), waiting %d seconds' % (n, kind, what, delay))
+        finally:
+            for p in self.procs.values():
+                tasks.put(None)
+            for p in self.procs.values():
+                p.join(1)
+                if p.is_alive():
+                    p.terminate()
+
+        return self.crawl.scrape_done
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1].startswith('-'):
+        print __doc__[__doc__.index('Usage:'):]
+        return 2
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+
+    dbcon = DBConnection(sys.argv[1])
+    dbcon.open()
+    crawl = Crawl(dbcon, int(get_arg("-dedupcache", 100000)))
+    reporter = metrics.Reporter(get_arg("-metrics"), get_arg("-metricsport"),
+                                get_arg("-metricsinterval", 10))
+    try:
+        crawl.open()
+        header = crawl.load(get_arg("-policy"))
+        if crawl.scrape_done:
+            logger.info('Scrape for this query is already finished')
+            return 0
+        coordinator = Coordinator(crawl, int(get_arg("-workers", 2)),
+                                  get_arg("-scholarurl", SCHOLAR_URL),
+                                  inflight=int(get_arg("-inflight", 4)),
+                                  rate=float(get_arg("-rate", 1)),
+                                  cache=None if "-nocache" in sys.argv else get_arg("-cache", DEFAULT_PATH),
+                                  offline="-offline" in sys.argv,
+                                  cookies=None if "-nocookies" in sys.argv else get_arg("-cookies", COOKIES_PATH))
+        done = coordinator.run(header)
+        logger.info('%d records, scrape %s' % (crawl.total_records,
+                                               'done' if done else 'not finished'))
+    except FetchError, e:
+        logger.error('Search stopped: %s' % e)
+        return 1
+    finally:
+        reporter.close()
+        crawl.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())